@@ -4,7 +4,8 @@
 controller.py - config-driven P4Runtime controller
 
 Reads per-switch JSON configs named "<sw_name>-config.json" from CONFIG_DIR and programs
-the switch accordingly. Falls back to hard-coded behavior when no config file exists.
+the switch accordingly. Falls back to the rule tables in genconfig.SWITCH_CONFIGS when
+no config file exists.
 
 Usage:
   - Put config files under ./configs/ such as configs/s11-config.json
@@ -13,25 +14,50 @@ Usage:
 """
 import os
 import sys
-import time
 import json
+import functools
+import hashlib
+import importlib.util
+import io
+import itertools
+import socket
+import threading
+import http.client
+import xmlrpc.client
 import grpc
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import psycopg2
-import psycopg2.extras
+try:
+    import orjson    # optional, faster JSON parsing
+except ImportError:
+    orjson = None
 
 
-# helper path used by the tutorials repo
-sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                             '../../utils/'))
+# helper path used by the tutorials repo (only needed when p4runtime_lib is not installed)
+if importlib.util.find_spec('p4runtime_lib') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '../../utils/'))
 import p4runtime_lib.bmv2
 import p4runtime_lib.helper
+from p4runtime_lib.convert import encode
 from p4runtime_lib.error_utils import printGrpcError
 from p4runtime_lib.switch import ShutdownAllSwitchConnections
+from p4runtime_lib.switch import GrpcRequestLogger, IterableQueue, connections
+
+from google.protobuf.internal import api_implementation
+from p4.config.v1 import p4info_pb2
+from p4.tmp import p4config_pb2
+from p4.v1 import p4runtime_pb2
+from p4.v1 import p4runtime_pb2_grpc
+
+from genconfig import ALL_CONFIGS_FILE, ALL_CONFIGS_VERSION, SWITCH_CONFIGS
 
 # --- Adjust these to suit your layout ---
 CONFIG_DIR = "configs"   # per-switch JSON files live here: e.g. configs/s11-config.json
+ENTRY_CACHE_DIR = ".cache"   # serialized table entries from previous runs
+ENTRY_CACHE_VERSION = b"1"   # part of every entry cache key; bump when the cached layout changes
+DAEMON_SOCKET = "/tmp/p4ctl.sock"   # unix socket of controller_daemon.py, if running
+P4INFO_BIN_SUFFIX = ".bin"   # binary P4Info cached next to the text file; see parse_p4info()
 
 # legacy defaults (kept for fallback behavior)
 TAG_SWITCH = {
@@ -57,43 +83,306 @@ DEFAULT_FILTER_BMV2_JSON = "build/filter.json"
 DEFAULT_P4INFO = "build/basic.p4.p4info.txtpb"
 DEFAULT_BMV2_JSON = "build/basic.json"
 
+# switch name -> (p4info, bmv2_json) defaults, built once from the switch roles
+PIPELINE = {name: (DEFAULT_TAG_P4INFO, DEFAULT_TAG_BMV2_JSON) for name in TAG_SWITCH}
+PIPELINE.update({name: (DEFAULT_FILTER_P4INFO, DEFAULT_FILTER_BMV2_JSON) for name in FILTER_SWITCH})
+
+# gRPC channel tuning: larger windows and message limits keep big pipeline
+# configs / batched writes from stalling. Keepalive pings stay within what a
+# gRPC server with default settings (BMv2 included) accepts: one per 5 min
+# without data, and none on a connection with no active call. More frequent
+# pings are answered with GOAWAY "too_many_pings", which would drop the
+# mastership stream of controller_daemon.py. The ping ack timeout is generous
+# so a switch busy loading a pipeline or a large batch is not mistaken for a dead one.
+GRPC_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 5 * 60 * 1000),
+    ('grpc.keepalive_timeout_ms', 20000),
+    ('grpc.max_send_message_length', 64 * 1024 * 1024),
+    ('grpc.max_receive_message_length', 64 * 1024 * 1024),
+    ('grpc.http2.lookahead_bytes', 1024 * 1024),
+]
+# number of gRPC channels (TCP connections) per switch, the mastership stream's
+# included; from two on, Write/Read calls never share the stream's connection
+GRPC_CHANNEL_POOL_SIZE = 2
+# seconds a pipeline install may take before it is reported as failed
+PIPELINE_TIMEOUT = 30
+# atomicity of batched writes: CONTINUE_ON_ERROR applies every valid update of a
+# batch and reports the failed ones; BMv2 implements only this mode
+WRITE_ATOMICITY = p4runtime_pb2.WriteRequest.CONTINUE_ON_ERROR
+# bound of the built-entry and encoded-value caches; controller_daemon.py keeps
+# them across pushes of edited configs, so the oldest items are evicted past this size
+ENTRY_CACHE_SIZE = 4096
+
+# open switch connections keyed by (address, device_id); see get_switch_connection()
+_CONN_CACHE = {}
+_CONN_CACHE_LOCK = threading.Lock()
+# one lock per (address, device_id): a switch is connected by a single thread
+_CONN_KEY_LOCKS = {}
+
+# file path -> (file_version, parsed P4Info helper); see load_p4info()
+_P4INFO_CACHE = {}
+_P4INFO_LOCK = threading.Lock()
+
+# switch configs loaded from <CONFIG_DIR>/<ALL_CONFIGS_FILE>; see _load_all()
+_ALL_CONFIGS = None
+_ALL_CONFIGS_LOCK = threading.Lock()
+
+# built entries keyed by (P4Info helper, canonical JSON of the entry); rows that
+# are identical across switches (e.g. the default drop action) are built once.
+# Bounded to ENTRY_CACHE_SIZE, oldest first out.
+_ENTRY_CACHE = {}
+_ENTRY_CACHE_LOCK = threading.Lock()
+
 
 # ---------------- DB operation --------------------
+# psycopg2 is imported inside these functions: controller.py does not use the DB
+# on its normal path, so importing the driver at startup is wasted work.
 
 def get_db_conn():
+    import psycopg2
     return psycopg2.connect(host='127.0.0.1', port=5432, dbname='p4controller', user='p4', password='p4pass')
 
 def fetch_tag_rules(conn, switch_name):
     """
-    Return list of dicts: { 'match': <dict_or_none>, 'tag_value': int, 'id': int }
+    Return list of tuples: (id, match <dict_or_none>, tag_value)
     match is the JSONB stored in tag_table (e.g. {"hdr.ipv4.srcAddr": ["192.168.11.0",24]})
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    with conn.cursor() as cur:
         cur.execute("SELECT id, match, tag_value FROM tag_table WHERE switch_name=%s ORDER BY id", (switch_name,))
-        rows = cur.fetchall()
-        return rows
+        return cur.fetchall()
 
 def fetch_filter_rules(conn, switch_name):
     """
-    Return list of dicts: { 'id': int, 'tag_value': int }
+    Return list of tuples: (id, tag_value)
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    with conn.cursor() as cur:
         cur.execute("SELECT id, tag_value FROM filter_table WHERE switch_name=%s ORDER BY id", (switch_name,))
         return cur.fetchall()
 
 
 
 # ---------------- helper utilities ----------------
+def json_loads(data):
+    """
+    Parse JSON bytes with orjson when installed, else the stdlib json module.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _load_all():
+    """
+    Load every switch config from <CONFIG_DIR>/<ALL_CONFIGS_FILE> once.
+    The file is ignored when it is missing, unreadable, of another version, or when
+    the <sw>-config.json files on disk differ from the ones it was written with
+    (e.g. a config was edited by hand after genconfig.py ran).
+
+    :return: dict switch name -> config (empty when the file is not usable)
+    """
+    global _ALL_CONFIGS
+    if _ALL_CONFIGS is None:
+        with _ALL_CONFIGS_LOCK:
+            if _ALL_CONFIGS is None:
+                configs = {}
+                path = os.path.join(CONFIG_DIR, ALL_CONFIGS_FILE)
+                try:
+                    with open(path, 'rb') as f:
+                        packed = json_loads(f.read())
+                    if packed.get('version') == ALL_CONFIGS_VERSION and _config_sources_match(packed['sources']):
+                        configs = packed['configs']
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"    ! Ignoring unreadable config file {path}: {e}")
+                _ALL_CONFIGS = configs
+    return _ALL_CONFIGS
+
+
+def _config_sources_match(sources):
+    """
+    :param sources: dict file name -> sha256 hex digest, as recorded by genconfig.py
+    :return: True if the <sw>-config.json files in CONFIG_DIR are exactly these
+    """
+    with os.scandir(CONFIG_DIR) as it:
+        names = {e.name for e in it if e.name.endswith('-config.json')}
+    if names != set(sources):
+        return False
+    for name, digest in sources.items():
+        with open(os.path.join(CONFIG_DIR, name), 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() != digest:
+                return False
+    return True
+
+
 def load_switch_config(sw_name):
     """
-    Load <CONFIG_DIR>/<sw_name>-config.json if present.
+    Load the config of sw_name from the combined config file, else from
+    <CONFIG_DIR>/<sw_name>-config.json if present.
     Returns a dict or None if not found.
     """
+    cfg = _load_all().get(sw_name)
+    if cfg is not None:
+        return cfg
     path = os.path.join(CONFIG_DIR, f"{sw_name}-config.json")
-    if not os.path.exists(path):
+    try:
+        with open(path, 'rb') as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
         return None
-    with open(path, 'r') as f:
-        return json.load(f)
+
+
+def load_default_config(sw_name):
+    """
+    Return the built-in rule table for sw_name from genconfig.SWITCH_CONFIGS,
+    the same declarative data the JSON configs are generated from.
+    Returns a dict or None if the switch is unknown.
+    """
+    return SWITCH_CONFIGS.get(sw_name)
+
+
+def cache_p4info_lookups(p4info_helper):
+    """
+    Memoize the name <-> id P4Info lookups that precompile_entries and
+    read_table_rules repeat for every entry. P4InfoHelper resolves names by
+    scanning the P4Info lists, and most entries of a switch share the same
+    table, action and field names. The helper is read-only after loading,
+    so the cached results never go stale.
+
+    :param p4info_helper: the P4Info helper
+    :return: the same helper with cached lookups
+    """
+    for attr in ('get_tables_id', 'get_actions_id', 'get_match_field', 'get_action_param',
+                 'get_tables_name', 'get_actions_name', 'get_match_field_name',
+                 'get_action_param_name'):
+        setattr(p4info_helper, attr, functools.lru_cache(maxsize=None)(getattr(p4info_helper, attr)))
+    return p4info_helper
+
+
+def parse_p4info(p4info_path):
+    """
+    Build a P4InfoHelper for p4info_path, parsing the text format only once.
+    The parsed P4Info is kept next to the file as binary protobuf
+    (<p4info_path>.bin) and reused while it is not older than the text file.
+
+    :param p4info_path: path to the P4Info text file
+    :return: the P4Info helper
+    """
+    bin_path = p4info_path + P4INFO_BIN_SUFFIX
+    try:
+        if os.stat(bin_path).st_mtime >= os.stat(p4info_path).st_mtime:
+            p4info = p4info_pb2.P4Info()
+            with open(bin_path, 'rb') as f:
+                p4info.ParseFromString(f.read())
+            # P4InfoHelper.__init__ only parses the file into self.p4info
+            helper = p4runtime_lib.helper.P4InfoHelper.__new__(p4runtime_lib.helper.P4InfoHelper)
+            helper.p4info = p4info
+            return helper
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"    ! Ignoring unreadable P4Info cache {bin_path}: {e}")
+
+    helper = p4runtime_lib.helper.P4InfoHelper(p4info_path)
+    # write to a temp file first so concurrent readers never see a partial cache
+    tmp_path = f"{bin_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(helper.p4info.SerializeToString())
+        os.replace(tmp_path, bin_path)
+    except OSError as e:
+        print(f"    ! Could not write P4Info cache {bin_path}: {e}")
+    return helper
+
+
+def file_version(path):
+    """
+    :return: (mtime_ns, size) of path; changes when the file is rebuilt
+    """
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_p4info(p4info_path):
+    """
+    Parse p4info_path once per version of the file and share the helper between
+    every switch that uses it. The helper is read-only after loading, so worker
+    threads can share it.
+    Switches are programmed concurrently and several of them share a P4Info
+    file; the lock makes the first caller parse it while the others wait,
+    instead of every thread parsing the same file at once. When the file was
+    rebuilt since it was parsed (a long-running controller_daemon.py), it is
+    parsed again and the entries built with the old helper are dropped.
+
+    :param p4info_path: path to the P4Info text file
+    :return: the P4Info helper
+    """
+    version = file_version(p4info_path)
+    cached = _P4INFO_CACHE.get(p4info_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _P4INFO_LOCK:
+        cached = _P4INFO_CACHE.get(p4info_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        helper = cache_p4info_lookups(parse_p4info(p4info_path))
+        _P4INFO_CACHE[p4info_path] = (version, helper)
+    if cached is not None:
+        old_helper = cached[1]
+        with _ENTRY_CACHE_LOCK:
+            for key in [key for key in _ENTRY_CACHE if key[0] is old_helper]:
+                del _ENTRY_CACHE[key]
+    return helper
+
+
+# suffix of config keys whose value is pre-packed hex (written by genconfig.py)
+HEX_SUFFIX = "_hex"
+
+
+def unhex_fields(fields):
+    """
+    Decode pre-packed fields: a "<name>_hex" key becomes "<name>" and its hex
+    string (or the first element of a [value, prefix_len] list) becomes bytes,
+    which encode_value passes through without parsing. Other keys are unchanged.
+
+    :param fields: match or action_params dict from a JSON entry
+    :return: dict with decoded fields
+    """
+    if not any(k.endswith(HEX_SUFFIX) for k in fields):
+        return fields
+    out = {}
+    for k, v in fields.items():
+        if k.endswith(HEX_SUFFIX):
+            k = k[:-len(HEX_SUFFIX)]
+            if isinstance(v, (list, tuple)):
+                v = [bytes.fromhex(v[0])] + list(v[1:])
+            else:
+                v = bytes.fromhex(v)
+        out[k] = v
+    return out
+
+
+def _normalize_list(raw):
+    # single-element lists keep their one-element form; others become tuples
+    if len(raw) == 1:
+        return (raw[0],)
+    return tuple(raw)
+
+
+def _normalize_scalar(raw):
+    # fallback: (value, 0) - caller should prefer two-element form for LPM
+    return (raw, 0)
+
+
+# exact type -> normalizer; bool is listed because isinstance(True, int) held
+# for the former isinstance chain
+_NORMALIZERS = {
+    list: _normalize_list,
+    tuple: lambda raw: raw,
+    str: lambda raw: (raw,),
+    int: _normalize_scalar,
+    bool: _normalize_scalar,
+}
 
 
 def normalize_match_value(raw):
@@ -106,153 +395,626 @@ def normalize_match_value(raw):
       - "192.168.11.1" (string alone) -> returns ("192.168.11.1",)  (single-element; helper accepts)
       - 12 (int) -> returns (12, 0)   (helper will index value[0] and value[1])
     """
-    # if already list/tuple convert to tuple
-    if isinstance(raw, (list, tuple)):
-        if len(raw) == 1:
-            return (raw[0],)
-        return tuple(raw)
-    # if it's a string or number, coerce into a one- or two-element tuple
-    if isinstance(raw, str):
-        # single-element tuple; helper will be passed ("a.b.c.d",)
-        return (raw,)
-    if isinstance(raw, int):
-        # fallback: (value, 0) - caller should prefer two-element form for LPM
-        return (raw, 0)
+    fn = _NORMALIZERS.get(type(raw))
     # unknown: return as-is to trigger a helpful error downstream
-    return raw
+    return fn(raw) if fn is not None else raw
+
+
+@functools.lru_cache(maxsize=ENTRY_CACHE_SIZE)
+def encode_value(value, bitwidth):
+    """
+    Encode a match/param value into the bytes P4Runtime expects.
+    Values that are already bytes are used as-is; strings (IPv4/MAC) and ints are
+    encoded by p4runtime_lib.convert.encode once and then served from the cache,
+    so an address that appears in many entries is only parsed once.
+
+    :param value: bytes, str, int or a one-element tuple
+    :param bitwidth: bit width of the field
+    :return: encoded bytes
+    """
+    if isinstance(value, bytes):
+        return value
+    return encode(value, bitwidth)
+
+
+def set_field_match(field_match, p4info_match, value, table_name):
+    """
+    Fill a FieldMatch from its P4Info match field and a normalized value.
+
+    :param field_match: the p4runtime_pb2.FieldMatch to fill
+    :param p4info_match: the P4Info MatchField
+    :param value: normalized match value (see normalize_match_value)
+    :param table_name: table name, only used in error messages
+    """
+    bitwidth = p4info_match.bitwidth
+    field_match.field_id = p4info_match.id
+    match_type = p4info_match.match_type
+    if match_type == p4info_pb2.MatchField.EXACT:
+        field_match.exact.value = encode_value(value, bitwidth)
+    elif match_type == p4info_pb2.MatchField.LPM:
+        field_match.lpm.value = encode_value(value[0], bitwidth)
+        field_match.lpm.prefix_len = value[1]
+    elif match_type == p4info_pb2.MatchField.TERNARY:
+        field_match.ternary.value = encode_value(value[0], bitwidth)
+        field_match.ternary.mask = encode_value(value[1], bitwidth)
+    elif match_type == p4info_pb2.MatchField.RANGE:
+        field_match.range.low = encode_value(value[0], bitwidth)
+        field_match.range.high = encode_value(value[1], bitwidth)
+    else:
+        raise ValueError(f"unsupported match type {match_type} for {table_name}.{p4info_match.name}")
+
+
+# ---------------- switch connection ----------------
+class TunedBmv2SwitchConnection(p4runtime_lib.bmv2.Bmv2SwitchConnection):
+    """
+    Bmv2SwitchConnection whose gRPC channels are created with channel options.
+    SwitchConnection.__init__ opens its channel without options, so this
+    mirrors that constructor and only changes how the channels are built.
 
+    Besides the primary channel (which carries the StreamChannel used for
+    mastership), a small pool of extra channels is opened so that concurrent
+    Write/Read calls are spread round-robin over separate TCP connections.
+    """
+
+    def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
+                 proto_dump_file=None, channel_options=GRPC_CHANNEL_OPTIONS,
+                 pool_size=GRPC_CHANNEL_POOL_SIZE):
+        self.name = name
+        self.address = address
+        self.device_id = device_id
+        self.p4info = None
+        self._channels = []
+        self._stubs = []
+        for i in range(max(1, pool_size)):
+            # a distinct channel arg keeps gRPC from sharing one subchannel
+            channel = grpc.insecure_channel(self.address, options=channel_options + [('p4ctl.channel_index', i)])
+            if proto_dump_file is not None:
+                interceptor = GrpcRequestLogger(proto_dump_file)
+                channel = grpc.intercept_channel(channel, interceptor)
+            self._channels.append(channel)
+            self._stubs.append(p4runtime_pb2_grpc.P4RuntimeStub(channel))
+        self._rr = itertools.count()
+        self.channel = self._channels[0]
+        self.client_stub = self._stubs[0]
+        self.requests_stream = IterableQueue()
+        self.stream_msg_resp = self.client_stub.StreamChannel(iter(self.requests_stream))
+        self.proto_dump_file = proto_dump_file
+        connections.append(self)
+
+    def next_stub(self):
+        """
+        :return: the next P4Runtime stub of the channel pool (round-robin); the
+                 first channel carries the mastership StreamChannel and is only
+                 used when there is no other
+        """
+        if len(self._stubs) == 1:
+            return self._stubs[0]
+        return self._stubs[1 + next(self._rr) % (len(self._stubs) - 1)]
+
+    def ReadTableEntries(self, table_id=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        entity.table_entry.table_id = table_id if table_id is not None else 0
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            for response in self.next_stub().Read(request):
+                yield response
+
+    def shutdown(self):
+        super().shutdown()
+        for channel in self._channels:
+            channel.close()
+
+
+def close_switch_connection(sw):
+    """
+    Shut down a switch connection and drop it from p4runtime_lib's connections
+    list, so ShutdownAllSwitchConnections() does not touch it again.
+
+    :param sw: the switch connection
+    """
+    try:
+        sw.shutdown()
+    finally:
+        if sw in connections:
+            connections.remove(sw)
 
-def build_entry_from_json(p4info_helper, entry_obj):
+
+def drop_switch_connection(sw_addr, device_id):
     """
-    Convert a JSON description into a p4runtime table entry (using p4info_helper.buildTableEntry).
-    
+    Forget and close the cached connection for (sw_addr, device_id), e.g. after
+    an RPC failed because the switch restarted; the next get_switch_connection()
+    reconnects and acquires mastership again.
+
+    :param sw_addr: the switch address
+    :param device_id: the device ID of switch
+    """
+    with _CONN_CACHE_LOCK:
+        sw = _CONN_CACHE.pop((sw_addr, device_id), None)
+    if sw is not None:
+        close_switch_connection(sw)
+
+
+def get_switch_connection(sw_name, sw_addr, device_id):
+    """
+    Return the connection for (sw_addr, device_id), opening it and acquiring
+    mastership only the first time. Later calls reuse the channel instead of
+    paying the TCP/HTTP2 handshake and arbitration again.
+    Concurrent callers for the same switch wait for the first one, so only one
+    connection (and one MasterArbitrationUpdate) is ever made per switch.
+    ShutdownAllSwitchConnections() still closes cached connections.
+
+    :param sw_name: the switch name
+    :param sw_addr: the switch address
+    :param device_id: the device ID of switch
+    :return: the switch connection
+    """
+    key = (sw_addr, device_id)
+    with _CONN_CACHE_LOCK:
+        sw = _CONN_CACHE.get(key)
+        if sw is not None:
+            return sw
+        key_lock = _CONN_KEY_LOCKS.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _CONN_CACHE_LOCK:
+            sw = _CONN_CACHE.get(key)
+        if sw is not None:
+            return sw
+
+        proto_dump = f"logs/{sw_name}-p4runtime.txt"
+        sw = TunedBmv2SwitchConnection(
+            name=sw_name,
+            address=sw_addr,
+            device_id=device_id,
+            proto_dump_file=proto_dump)
+
+        # acquire mastership
+        try:
+            sw.MasterArbitrationUpdate()
+        except Exception as e:
+            print(f"    ! Master arbitration/update failed for {sw_name}: {e}")
+            close_switch_connection(sw)
+            raise
+
+        with _CONN_CACHE_LOCK:
+            _CONN_CACHE[key] = sw
+        return sw
+
+
+def validate_entries(p4info_helper, entries):
+    """
+    Check JSON entries against the P4Info before anything is sent to the switch:
+    the table and action exist, the action belongs to the table, match field
+    names are fields of the table, and action_params name exactly the params of
+    the action. All problems are reported together.
+
+    :param p4info_helper: the P4Info helper
+    :param entries: list of JSON entry dicts
+    :raises ValueError: if any entry is invalid
+    """
+    tables = {}     # table name -> (action ids, match field names), or None if unknown
+    actions = {}    # action name -> (action id, param names), or None if unknown
+    errors = []
+    for i, entry_obj in enumerate(entries):
+        table_name = entry_obj.get('table')
+        if table_name is None:
+            errors.append(f"entry {i}: missing 'table' field")
+            continue
+        if table_name not in tables:
+            try:
+                table = p4info_helper.get('tables', name=table_name)
+                tables[table_name] = ({ref.id for ref in table.action_refs},
+                                      {mf.name for mf in table.match_fields})
+            except AttributeError:
+                tables[table_name] = None
+        if tables[table_name] is None:
+            errors.append(f"entry {i}: unknown table {table_name!r}")
+            continue
+        action_ids, field_names = tables[table_name]
+
+        match = entry_obj.get('match')
+        if not entry_obj.get('default_action', False) and isinstance(match, dict):
+            for field_name in match:
+                if field_name.endswith(HEX_SUFFIX):
+                    field_name = field_name[:-len(HEX_SUFFIX)]
+                if field_name not in field_names:
+                    errors.append(f"entry {i}: {table_name!r} has no match field {field_name!r}")
+
+        action_name = entry_obj.get('action_name')
+        if not action_name:
+            continue
+        if action_name not in actions:
+            try:
+                action = p4info_helper.get('actions', name=action_name)
+                actions[action_name] = (action.preamble.id, {p.name for p in action.params})
+            except AttributeError:
+                actions[action_name] = None
+        if actions[action_name] is None:
+            errors.append(f"entry {i}: unknown action {action_name!r}")
+            continue
+        action_id, param_names = actions[action_name]
+        if action_id not in action_ids:
+            errors.append(f"entry {i}: action {action_name!r} is not an action of {table_name!r}")
+        given = {name[:-len(HEX_SUFFIX)] if name.endswith(HEX_SUFFIX) else name
+                 for name in entry_obj.get('action_params') or {}}
+        if given != param_names:
+            errors.append(f"entry {i}: {action_name!r} expects params {sorted(param_names)}, got {sorted(given)}")
+
+    if errors:
+        raise ValueError("invalid table entries:\n  " + "\n  ".join(errors))
+
+
+def precompile_entries(p4info_helper, entries):
+    """
+    Build (table_name, table_entry) tuples for a whole list of JSON entries.
+    Table, action, match field and param metadata are resolved once per name for
+    the batch and the TableEntry messages are filled with the resolved ids, so
+    rows sharing a table/action (most rows of a switch) skip the P4Info lookups.
+    Rows already built for another switch are copied from _ENTRY_CACHE; how many
+    were reused is printed, so a missing hit is visible.
+
     Supported JSON fields (per entry):
       - table (string) [required]
       - default_action (bool) [optional]
       - match (dict) [optional] : match field name -> value (see normalize_match_value)
       - action_name (string) [required for non-default]
       - action_params (dict) [optional]
-    Returns a (table_name, table_entry) tuple.
+
+    :param p4info_helper: the P4Info helper
+    :param entries: list of JSON entry dicts
+    :return: list of (table_name, table_entry)
     """
-    if 'table' not in entry_obj:
-        raise ValueError("table entry missing 'table' field")
+    table_ids = {}
+    action_ids = {}
+    match_fields = {}     # (table_name, field_name) -> P4Info MatchField
+    action_params = {}    # (action_name, param_name) -> P4Info Action.Param
+    tbl_entries = []
+    reused = 0
+    for entry_obj in entries:
+        if 'table' not in entry_obj:
+            raise ValueError("table entry missing 'table' field")
+        table_name = entry_obj['table']
+        row_key = (p4info_helper, json.dumps(entry_obj, sort_keys=True))
+        cached = _ENTRY_CACHE.get(row_key)
+        if cached is not None:
+            table_entry = p4runtime_pb2.TableEntry()
+            table_entry.CopyFrom(cached)
+            tbl_entries.append((table_name, table_entry))
+            reused += 1
+            continue
 
-    table_name = entry_obj['table']
+        table_id = table_ids.get(table_name)
+        if table_id is None:
+            table_id = table_ids[table_name] = p4info_helper.get_tables_id(table_name)
+        table_entry = p4runtime_pb2.TableEntry()
+        table_entry.table_id = table_id
+
+        if entry_obj.get('default_action', False):
+            table_entry.is_default_action = True
+        else:
+            match = entry_obj.get('match')
+            if isinstance(match, dict):
+                for field_name, raw in unhex_fields(match).items():
+                    mf_key = (table_name, field_name)
+                    p4info_match = match_fields.get(mf_key)
+                    if p4info_match is None:
+                        p4info_match = match_fields[mf_key] = p4info_helper.get_match_field(table_name, field_name)
+                    set_field_match(table_entry.match.add(), p4info_match,
+                                    normalize_match_value(raw), table_name)
 
-    # default action case
-    if entry_obj.get('default_action', False):
         action_name = entry_obj.get('action_name')
-        action_params = entry_obj.get('action_params', {}) or {}
-        entry = p4info_helper.buildTableEntry(
-            table_name=table_name,
-            default_action=True,
-            action_name=action_name,
-            action_params=action_params
-        )
-        return table_name, entry
-
-    # normal entry with match fields
-    match_fields = {}
-    if 'match' in entry_obj and isinstance(entry_obj['match'], dict):
-        for k, v in entry_obj['match'].items():
-            match_fields[k] = normalize_match_value(v)
-
-    action_name = entry_obj.get('action_name')
-    action_params = entry_obj.get('action_params', {}) or {}
-
-    table_entry = p4info_helper.buildTableEntry(
-        table_name=table_name,
-        match_fields=match_fields,
-        action_name=action_name,
-        action_params=action_params
-    )
-    return table_name, table_entry
+        if action_name:
+            action_id = action_ids.get(action_name)
+            if action_id is None:
+                action_id = action_ids[action_name] = p4info_helper.get_actions_id(action_name)
+            action = table_entry.action.action
+            action.action_id = action_id
+            for param_name, value in unhex_fields(entry_obj.get('action_params') or {}).items():
+                param_key = (action_name, param_name)
+                p4info_param = action_params.get(param_key)
+                if p4info_param is None:
+                    p4info_param = action_params[param_key] = p4info_helper.get_action_param(action_name, param_name)
+                param = action.params.add()
+                param.param_id = p4info_param.id
+                param.value = encode_value(value, p4info_param.bitwidth)
+        with _ENTRY_CACHE_LOCK:
+            if row_key not in _ENTRY_CACHE:
+                if len(_ENTRY_CACHE) >= ENTRY_CACHE_SIZE:
+                    del _ENTRY_CACHE[next(iter(_ENTRY_CACHE))]
+                _ENTRY_CACHE[row_key] = table_entry
+        tbl_entries.append((table_name, table_entry))
+    if reused:
+        print(f"    -> Reused {reused} of {len(entries)} table entries already built for other switches")
+    return tbl_entries
+
+
+def build_entries_cached(sw_name, p4info_path, p4info_helper, entries):
+    """
+    Build (table_name, table_entry) tuples for JSON entries, reusing the result of a
+    previous run when neither the p4info file nor the entries changed.
+    Built entries are stored under ENTRY_CACHE_DIR as a serialized ReadResponse,
+    keyed by sha256(ENTRY_CACHE_VERSION + p4info content + canonical JSON of entries).
+    Only the latest file of each switch is kept.
+
+    :param sw_name: the switch name
+    :param p4info_path: path to the P4Info file the entries are built against
+    :param p4info_helper: the P4Info helper
+    :param entries: list of JSON entry dicts
+    :return: list of (table_name, table_entry)
+    """
+    key = hashlib.sha256(ENTRY_CACHE_VERSION)
+    with open(p4info_path, 'rb') as f:
+        key.update(f.read())
+    # sort_keys: equal entries give the same key whatever order their dicts were built in
+    key.update(json.dumps(entries, sort_keys=True).encode())
+    prefix = f"entries_{sw_name}_"
+    cache_path = os.path.join(ENTRY_CACHE_DIR, f"{prefix}{key.hexdigest()}.bin")
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = p4runtime_pb2.ReadResponse.FromString(f.read())
+        return [(p4info_helper.get_tables_name(entity.table_entry.table_id), entity.table_entry)
+                for entity in cached.entities]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"    ! Ignoring unreadable entry cache {cache_path}: {e}")
+
+    try:
+        tbl_entries = precompile_entries(p4info_helper, entries)
+    except Exception as ex:
+        print(f"    ! Error building table entry from JSON: {ex}")
+        raise
+
+    # write to a temp file first so concurrent switches never read a partial cache
+    os.makedirs(ENTRY_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    cached = p4runtime_pb2.ReadResponse()
+    for (tname, tentry) in tbl_entries:
+        cached.entities.add().table_entry.CopyFrom(tentry)
+    with open(tmp_path, 'wb') as f:
+        f.write(cached.SerializeToString())
+    os.replace(tmp_path, cache_path)
+
+    # the files of older configs or P4Info versions of this switch are never read again
+    for name in os.listdir(ENTRY_CACHE_DIR):
+        if name.startswith(prefix) and name.endswith('.bin') and name != os.path.basename(cache_path):
+            try:
+                os.remove(os.path.join(ENTRY_CACHE_DIR, name))
+            except FileNotFoundError:
+                pass
+    return tbl_entries
 
 
 # ---------------- core programming functions ----------------
+@functools.lru_cache(maxsize=16)
+def load_bmv2_json(bmv2_json_path, version):
+    """
+    Read a BMv2 JSON file once per version; switches running the same program
+    share the bytes, and a rebuilt file (new version) is read again.
+
+    :param bmv2_json_path: path to the BMv2 JSON file
+    :param version: file_version() of the file, part of the cache key
+    :return: file content as bytes
+    """
+    with open(bmv2_json_path, 'rb') as f:
+        return f.read()
+
+
+def pipeline_cookie(p4info_helper, device_data):
+    """
+    :param p4info_helper: the P4Info helper
+    :param device_data: BMv2 JSON bytes
+    :return: 64-bit cookie identifying this (p4info, BMv2 JSON) pair
+    """
+    digest = hashlib.sha256(p4info_helper.p4info.SerializeToString(deterministic=True) + device_data).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def load_pipeline_artifact(p4info_helper, bmv2_json_path):
+    """
+    Prepare the pipeline payload for a (P4Info, BMv2 JSON) pair once; every
+    switch running the same program reuses the serialized P4DeviceConfig and
+    cookie instead of re-hashing and re-serializing the BMv2 JSON.
+    P4Info helpers are shared per file version (see load_p4info), so together
+    with the BMv2 JSON version they key the cache.
+
+    :param p4info_helper: the P4Info helper
+    :param bmv2_json_path: path to the BMv2 JSON file
+    :return: (serialized P4DeviceConfig, cookie)
+    """
+    return _load_pipeline_artifact(p4info_helper, bmv2_json_path, file_version(bmv2_json_path))
+
+
+@functools.lru_cache(maxsize=16)
+def _load_pipeline_artifact(p4info_helper, bmv2_json_path, version):
+    device_data = load_bmv2_json(bmv2_json_path, version)
+    device_config = p4config_pb2.P4DeviceConfig()
+    device_config.reassign = True
+    device_config.device_data = device_data
+    return device_config.SerializeToString(), pipeline_cookie(p4info_helper, device_data)
+
+
+def get_pipeline_cookie(sw):
+    """
+    Ask the switch for the cookie of its current pipeline (COOKIE_ONLY, no config transfer).
+
+    :param sw: the switch connection
+    :return: cookie int, or None if the switch has no pipeline/cookie
+    """
+    request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
+    request.device_id = sw.device_id
+    request.response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY
+    try:
+        response = sw.client_stub.GetForwardingPipelineConfig(request)
+    except grpc.RpcError:
+        return None
+    if not response.config.HasField('cookie'):
+        return None
+    return response.config.cookie.cookie
+
+
 def set_pipeline(sw, p4info_helper, bmv2_json_path):
     """
-    Try to install the forwarding pipeline. If permission denied or pipeline already set,
-    warn and continue.
+    Start installing the forwarding pipeline without waiting for it: the RPC is
+    issued with .future() so the caller can build its table entries while the
+    switch loads the pipeline, then finish with wait_pipeline().
+
+    The pipeline is tagged with a cookie derived from the p4info and BMv2 JSON;
+    if the switch already runs a pipeline with the same cookie, the install is skipped.
+
+    :return: the in-flight RPC future, or None if the install was skipped
+    """
+    p4_device_config, cookie = load_pipeline_artifact(p4info_helper, bmv2_json_path)
+    if get_pipeline_cookie(sw) == cookie:
+        print(f"    -> Pipeline (JSON: {bmv2_json_path}) already installed on {sw.name}; skipping")
+        return None
+
+    request = p4runtime_pb2.SetForwardingPipelineConfigRequest()
+    request.device_id = sw.device_id
+    request.election_id.low = 1
+    request.action = p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT
+    config = request.config
+    config.p4info.CopyFrom(p4info_helper.p4info)
+    config.p4_device_config = p4_device_config
+    config.cookie.cookie = cookie
+    print(f"    -> Installing pipeline (JSON: {bmv2_json_path}) on {sw.name}")
+    return sw.client_stub.SetForwardingPipelineConfig.future(request, timeout=PIPELINE_TIMEOUT)
+
+
+def wait_pipeline(sw, future):
+    """
+    Wait for a pipeline install started by set_pipeline(). If the switch
+    reports that a pipeline is already set, warn and continue; any other
+    failure (deadline exceeded, unreachable switch, rejected config) is raised,
+    since writing entries without a pipeline cannot succeed.
+
+    :param sw: the switch connection
+    :param future: the future returned by set_pipeline()
     """
     try:
-        print(f"    -> Installing pipeline (JSON: {bmv2_json_path}) on {sw.name}")
-        sw.SetForwardingPipelineConfig(
-            p4info=p4info_helper.p4info,
-            bmv2_json_file_path=bmv2_json_path)
+        future.result()
     except grpc.RpcError as e:
         # tolerate already-installed pipelines
-        print(f"    ! SetForwardingPipelineConfig warning for {sw.name}: {getattr(e, 'code', lambda: '')()} {getattr(e, 'details', lambda: '')()}")
-        print("    ! Continuing (pipeline may already be installed).")
+        if e.code() in (grpc.StatusCode.ALREADY_EXISTS, grpc.StatusCode.FAILED_PRECONDITION):
+            print(f"    ! SetForwardingPipelineConfig warning for {sw.name}: {e.code()} {e.details()}")
+            print("    ! Continuing (pipeline may already be installed).")
+        else:
+            print(f"    ! Failed to install pipeline on {sw.name}")
+            printGrpcError(e)
+            raise
 
 
-def write_entries(sw, tbl_entries):
+def clear_table_entries(sw):
     """
-    Write a list of (table_name, entry) tuples to switch sw.
+    Delete every (non-default) table entry on switch sw in one WriteRequest.
+    Used when the pipeline is kept, since only a pipeline install resets the tables.
+
+    :param sw: the switch connection
     """
-    for (tname, entry) in tbl_entries:
-        try:
-            sw.WriteTableEntry(entry)
-            print(f"    -> Inserted entry into table '{tname}' on {sw.name}")
-        except Exception as e:
-            print(f"    ! Failed to insert entry into '{tname}' on {sw.name}: {e}")
-            if isinstance(e, grpc.RpcError):
-                printGrpcError(e)
-            raise
+    request = p4runtime_pb2.WriteRequest()
+    request.device_id = sw.device_id
+    request.election_id.low = 1
+    for response in sw.ReadTableEntries():
+        for entity in response.entities:
+            update = request.updates.add()
+            update.type = p4runtime_pb2.Update.DELETE
+            update.entity.table_entry.CopyFrom(entity.table_entry)
+    if request.updates:
+        print(f"    -> Deleting {len(request.updates)} existing entries on {sw.name}")
+        sw.next_stub().Write(request)
 
 
-def program_from_config(sw_name, sw_addr, device_id):
+def write_entries(sw, tbl_entries, atomicity=WRITE_ATOMICITY):
     """
-    Load config for sw_name and program the switch accordingly.
+    Write a list of (table_name, entry) tuples to switch sw.
+
+    All entries are sent as updates of a single WriteRequest, so the whole
+    list costs one gRPC round trip instead of one per entry. Write is a unary
+    RPC in P4Runtime (StreamChannel only carries arbitration and packet I/O),
+    so batching is how writes share a stream; the HTTP/2 connection itself is
+    the switch's long-lived channel.
+
+    atomicity is the WriteRequest.Atomicity of the batch (see WRITE_ATOMICITY);
+    with CONTINUE_ON_ERROR a failed entry does not stop the rest of the batch.
     """
-    print(f"\n----- Connecting to {sw_name} @ {sw_addr} (device_id={device_id}) -----")
-    proto_dump = f"logs/{sw_name}-p4runtime.txt"
-    sw = p4runtime_lib.bmv2.Bmv2SwitchConnection(
-        name=sw_name,
-        address=sw_addr,
-        device_id=device_id,
-        proto_dump_file=proto_dump)
-
-    # acquire mastership
+    request = p4runtime_pb2.WriteRequest()
+    request.device_id = sw.device_id
+    request.election_id.low = 1
+    request.atomicity = atomicity
+    for (tname, entry) in tbl_entries:
+        update = request.updates.add()
+        # default entries always exist on the switch; they can only be modified
+        if entry.is_default_action:
+            update.type = p4runtime_pb2.Update.MODIFY
+        else:
+            update.type = p4runtime_pb2.Update.INSERT
+        update.entity.table_entry.CopyFrom(entry)
+
     try:
-        sw.MasterArbitrationUpdate()
+        sw.next_stub().Write(request)
     except Exception as e:
-        print(f"    ! Master arbitration/update failed for {sw_name}: {e}")
+        print(f"    ! Failed to write {len(tbl_entries)} entries on {sw.name}: {e}")
+        if isinstance(e, grpc.RpcError):
+            printGrpcError(e)
         raise
+    # one buffered write for the whole batch instead of a print per entry
+    suffix = f"' on {sw.name}\n"
+    out = io.StringIO()
+    for (tname, entry) in tbl_entries:
+        out.write("    -> Inserted entry into table '")
+        out.write(tname)
+        out.write(suffix)
+    sys.stdout.write(out.getvalue())
 
-    # try to find config JSON for this switch
-    cfg = load_switch_config(sw_name)
-    # choose p4info helper and bmv2_json path from either config or defaults
-    if cfg:
-        p4info_path = cfg.get('p4info', DEFAULT_P4INFO)
-        bmv2_json = cfg.get('bmv2_json', DEFAULT_BMV2_JSON)
-        entries = cfg.get('table_entries', [])
-        p4info_helper = p4runtime_lib.helper.P4InfoHelper(p4info_path)
-
-        # install pipeline if bmv2_json is provided
-        if bmv2_json:
-            set_pipeline(sw, p4info_helper, bmv2_json)
-
-        # build table entries
-        tbl_entries = []
-        for e in entries:
-            try:
-                tname, tentry = build_entry_from_json(p4info_helper, e)
-                tbl_entries.append((tname, tentry))
-            except Exception as ex:
-                print(f"    ! Error building table entry from JSON: {ex}")
-                raise
-
-        # write entries
-        if tbl_entries:
-            print(f"    -> Writing {len(tbl_entries)} table entries to {sw_name}")
-            write_entries(sw, tbl_entries)
-        else:
-            print(f"    -> No table entries found in {sw_name}-config.json")
+
+def program_from_config(sw_name, sw_addr, device_id, cfg=None):
+    """
+    Load config for sw_name (unless cfg is given) and program the switch accordingly.
+    """
+    print(f"\n----- Connecting to {sw_name} @ {sw_addr} (device_id={device_id}) -----")
+    sw = get_switch_connection(sw_name, sw_addr, device_id)
+
+    # try to find config JSON for this switch, else use the built-in rule table
+    if cfg is None:
+        cfg = load_switch_config(sw_name)
+    if cfg is None:
+        print(f"    -> No config file for {sw_name}; using built-in rules from genconfig.SWITCH_CONFIGS")
+        cfg = load_default_config(sw_name)
+    if cfg is None:
+        raise ValueError(f"no config file or built-in rules for {sw_name}")
+
+    # choose p4info helper and bmv2_json path from either config or the switch's role defaults
+    default_p4info, default_bmv2_json = PIPELINE.get(sw_name, (DEFAULT_P4INFO, DEFAULT_BMV2_JSON))
+    p4info_path = cfg.get('p4info', default_p4info)
+    bmv2_json = cfg.get('bmv2_json', default_bmv2_json)
+    entries = cfg.get('table_entries', [])
+    p4info_helper = load_p4info(p4info_path)
+
+    # reject bad entries before touching the switch, not halfway through a Write
+    validate_entries(p4info_helper, entries)
+
+    # start the pipeline install if bmv2_json is provided
+    pipeline_future = set_pipeline(sw, p4info_helper, bmv2_json) if bmv2_json else None
+
+    # build table entries (or load them from the entry cache) while the switch loads the pipeline
+    tbl_entries = build_entries_cached(sw_name, p4info_path, p4info_helper, entries)
+
+    if pipeline_future is not None:
+        wait_pipeline(sw, pipeline_future)
+    elif bmv2_json:
+        # pipeline kept: remove the entries of the previous run before rewriting them
+        clear_table_entries(sw)
+
+    # write entries
+    if tbl_entries:
+        print(f"    -> Writing {len(tbl_entries)} table entries to {sw_name}")
+        write_entries(sw, tbl_entries)
     else:
-        # FALLBACK: old behavior (keeps existing logic so you can migrate)
-        print(f"    -> No config file for {sw_name}; using legacy hard-coded programming")
-        
+        print(f"    -> No table entries found for {sw_name}")
+
     # Return the switch connection to allow later ReadTableEntries
     return sw, p4info_helper
 
@@ -260,33 +1022,151 @@ def program_from_config(sw_name, sw_addr, device_id):
 # Refer p4runtime/mycontroller.py
 def read_table_rules(p4info_helper, sw):
     """
-    Reads the table entries from all tables on the switch.
+    Reads the table entries from all tables on the switch and writes the
+    whole dump with a single call.
 
     :param p4info_helper: the P4Info helper
     :param sw: the switch connection
     """
-    print('\n----- Reading tables rules for %s -----' % sw.name)
-    for response in sw.ReadTableEntries():
-        for entity in response.entities:
-            entry = entity.table_entry
-            # TODO For extra credit, you can use the p4info_helper to translate
-            #      the IDs in the entry to names
-            table_name = p4info_helper.get_tables_name(entry.table_id)
-            print('%s: ' % table_name, end=' ')
-            for m in entry.match:
-                print(p4info_helper.get_match_field_name(table_name, m.field_id), end=' ')
-                print('%r' % (p4info_helper.get_match_field_value(m),), end=' ')
-            action = entry.action.action
-            action_name = p4info_helper.get_actions_name(action.action_id)
-            print('->', action_name, end=' ')
-            for p in action.params:
-                print(p4info_helper.get_action_param_name(action_name, p.param_id), end=' ')
-                print('%r' % p.value, end=' ')
-            print()
+    sys.stdout.write(format_table_rules(p4info_helper, sw))
+
+
+def format_table_rules(p4info_helper, sw):
+    """
+    Read the table entries from all tables on the switch and format them, one line per entry.
+    The Read stream is drained first so it is not held back by formatting; table,
+    field, action and param names are resolved once per id.
+
+    :param p4info_helper: the P4Info helper
+    :param sw: the switch connection
+    :return: the formatted dump
+    """
+    entries = [entity.table_entry
+               for response in sw.ReadTableEntries()
+               for entity in response.entities]
+
+    table_names = {}
+    field_names = {}
+    action_names = {}
+    param_names = {}
+    lines = ['\n----- Reading tables rules for %s -----\n' % sw.name]
+    for entry in entries:
+        table_name = table_names.get(entry.table_id)
+        if table_name is None:
+            table_name = table_names[entry.table_id] = p4info_helper.get_tables_name(entry.table_id)
+        parts = [table_name, ': ']
+        for m in entry.match:
+            key = (table_name, m.field_id)
+            field_name = field_names.get(key)
+            if field_name is None:
+                field_name = field_names[key] = p4info_helper.get_match_field_name(table_name, m.field_id)
+            parts.append(' ')
+            parts.append(field_name)
+            parts.append(' ')
+            parts.append(repr(p4info_helper.get_match_field_value(m)))
+        action = entry.action.action
+        action_name = action_names.get(action.action_id)
+        if action_name is None:
+            action_name = action_names[action.action_id] = p4info_helper.get_actions_name(action.action_id)
+        parts.append(' -> ')
+        parts.append(action_name)
+        for p in action.params:
+            key = (action_name, p.param_id)
+            param_name = param_names.get(key)
+            if param_name is None:
+                param_name = param_names[key] = p4info_helper.get_action_param_name(action_name, p.param_id)
+            parts.append(' ')
+            parts.append(param_name)
+            parts.append(' ')
+            parts.append(repr(p.value))
+        parts.append('\n')
+        lines.append(''.join(parts))
+    return ''.join(lines)
+
+
+# ---------------- controller daemon client ----------------
+class UnixStreamHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTPConnection over a unix socket; the host name is only used in headers.
+    """
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class UnixStreamTransport(xmlrpc.client.Transport):
+    """
+    XML-RPC transport talking to controller_daemon.py on its unix socket.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def make_connection(self, host):
+        return UnixStreamHTTPConnection(self.path)
+
+
+def daemon_running(path=DAEMON_SOCKET):
+    """
+    :param path: unix socket path of controller_daemon.py
+    :return: True if a daemon accepts connections on path (a socket file left
+             behind by a dead daemon refuses them)
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def push_to_daemon(switches):
+    """
+    Program the switches through controller_daemon.py, which keeps the switch
+    channels, mastership and P4Info helpers open between runs, then print
+    each switch's tables as read back by the daemon.
+
+    :param switches: dict switch name -> (address, device_id)
+    :raises OSError: if the daemon cannot be reached
+    """
+    proxy = xmlrpc.client.ServerProxy('http://localhost/', transport=UnixStreamTransport(DAEMON_SOCKET),
+                                      allow_none=True)
+    for sw_name in switches:
+        cfg = load_switch_config(sw_name)
+        if cfg is None:
+            cfg = load_default_config(sw_name)
+        if cfg is None:
+            print(f"[!] Error during programming of {sw_name}: no config file or built-in rules")
+            continue
+        print(f"\n----- Pushing config of {sw_name} to the controller daemon -----")
+        try:
+            n = proxy.push_config(sw_name, cfg)
+            print(f"    -> {n} table entries written to {sw_name}")
+            sys.stdout.write(proxy.read_table(sw_name))
+        except xmlrpc.client.Fault as e:
+            print(f"[!] Error during programming of {sw_name}: {e.faultString}")
 
 
 # ---------------- main ----------------
+def check_protobuf_backend():
+    """
+    Warn when protobuf runs on its pure-Python implementation, which is many
+    times slower at building and serializing the P4Runtime messages.
+    """
+    backend = api_implementation.Type()
+    if backend == 'python':
+        print("[!] protobuf is using the pure-Python backend; install a protobuf wheel "
+              "with the upb/cpp extension (or unset PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION)")
+
+
 def main():
+    check_protobuf_backend()
     all_conns = []
     try:
         # assemble the list of switches to program:
@@ -294,17 +1174,46 @@ def main():
         switches = {}
         switches.update(FILTER_SWITCH)
         switches.update(TAG_SWITCH)
-        
-        for sw_name, (addr, dev_id) in switches.items():
+
+        # a running controller_daemon.py already holds the switch connections.
+        # Only an unreachable daemon falls back to connecting directly: once it
+        # answered, it keeps its mastership even if it fails later on
+        if daemon_running():
             try:
-                sw_conn, p4info_helper = program_from_config(sw_name, addr, dev_id)
+                push_to_daemon(switches)
+                print("[+] Done programming all switches (via controller daemon).")
+            except OSError as e:
+                print(f"[!] Lost the controller daemon at {DAEMON_SOCKET}: {e}")
+            return
+
+        # switches are independent, so program them concurrently; every switch
+        # gets its own connection, P4Info helpers are shared per file. Each
+        # switch's read-back is submitted as soon as it is programmed.
+        # Results are only collected here in the main thread, so all_conns
+        # needs no lock.
+        with ThreadPoolExecutor(max_workers=len(switches)) as executor:
+            futures = {
+                executor.submit(program_from_config, sw_name, addr, dev_id): sw_name
+                for sw_name, (addr, dev_id) in switches.items()
+            }
+            reads = {}
+            for future in as_completed(futures):
+                sw_name = futures[future]
+                try:
+                    sw_conn, p4info_helper = future.result()
+                except Exception as e:
+                    print(f"[!] Error during programming of {sw_name}: {e}")
+                    # continue to the next switch (do not abort all)
+                    continue
                 all_conns.append(sw_conn)
                 # read back tables using the same p4info helper used for programming
-                read_table_rules(p4info_helper, sw_conn)
-            except Exception as e:
-                print(f"[!] Error during programming of {sw_name}: {e}")
-                # continue to the next switch (do not abort all)
-                continue
+                reads[executor.submit(read_table_rules, p4info_helper, sw_conn)] = sw_name
+
+            for future in as_completed(reads):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"[!] Error while reading back tables of {reads[future]}: {e}")
 
         print("[+] Done programming all switches.")
     except KeyboardInterrupt:
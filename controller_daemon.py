@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+controller_daemon.py - long-lived companion of controller.py
+
+Opens the switch connections once (gRPC channels + mastership), keeps them and
+the parsed P4Info helpers warm, and serves XML-RPC on the unix socket
+controller.DAEMON_SOCKET. While it runs, controller.py pushes its configs here
+instead of connecting to every switch itself.
+P4 artifacts rebuilt on disk are picked up on the next push (the caches in
+controller.py are keyed on file versions), and the connection of a switch whose
+RPC fails is dropped, so a restarted switch is reconnected.
+
+Exposed calls:
+  - push_config(sw_name, cfg) -> number of table entries written
+  - read_table(sw_name)       -> formatted table dump
+
+Usage:
+  - Start BMv2 switches, then run:
+      ./controller_daemon.py
+  - Later runs of ./controller.py use the daemon automatically.
+"""
+import os
+import sys
+import socketserver
+from xmlrpc.server import SimpleXMLRPCDispatcher, SimpleXMLRPCRequestHandler
+
+import controller
+import grpc
+
+
+class UnixXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):
+    # TCP_NODELAY cannot be set on a unix socket
+    disable_nagle_algorithm = False
+
+    def address_string(self):
+        # unix socket peers have no address; used when logging errors
+        return controller.DAEMON_SOCKET
+
+
+class UnixXMLRPCServer(socketserver.UnixStreamServer, SimpleXMLRPCDispatcher):
+    """
+    SimpleXMLRPCServer over a unix socket. Requests are handled one at a time,
+    so two clients never program the same switch concurrently.
+    """
+
+    def __init__(self, path):
+        self.logRequests = False
+        SimpleXMLRPCDispatcher.__init__(self, allow_none=True, encoding=None)
+        socketserver.UnixStreamServer.__init__(self, path, UnixXMLRPCRequestHandler)
+
+
+class ControllerService:
+    """
+    XML-RPC methods; switch addresses come from controller.FILTER_SWITCH/TAG_SWITCH.
+    """
+
+    def __init__(self):
+        self.switches = {}
+        self.switches.update(controller.FILTER_SWITCH)
+        self.switches.update(controller.TAG_SWITCH)
+        # switch name -> (switch connection, P4Info helper) of the last push
+        self.programmed = {}
+
+    def connect_all(self):
+        """
+        Open every known switch connection up front so the first push does not
+        pay the channel setup and mastership arbitration.
+        """
+        for sw_name, (addr, dev_id) in self.switches.items():
+            try:
+                controller.get_switch_connection(sw_name, addr, dev_id)
+            except Exception as e:
+                print(f"[!] Could not connect to {sw_name} @ {addr}: {e}")
+
+    def push_config(self, sw_name, cfg):
+        if sw_name not in self.switches:
+            raise ValueError(f"unknown switch {sw_name!r}")
+        # the daemon has no config on disk to fall back to: the client sends it
+        if not isinstance(cfg, dict):
+            raise TypeError(f"config for {sw_name!r} must be a dict, got {type(cfg).__name__}")
+        addr, dev_id = self.switches[sw_name]
+        try:
+            sw, p4info_helper = controller.program_from_config(sw_name, addr, dev_id, cfg=cfg)
+        except grpc.RpcError as e:
+            self.drop(sw_name)
+            if e.code() != grpc.StatusCode.UNAVAILABLE:
+                raise
+            # the switch restarted since the connection was made: reconnect once
+            print(f"[!] {sw_name} unavailable on its cached connection; reconnecting")
+            try:
+                sw, p4info_helper = controller.program_from_config(sw_name, addr, dev_id, cfg=cfg)
+            except grpc.RpcError:
+                self.drop(sw_name)
+                raise
+        self.programmed[sw_name] = (sw, p4info_helper)
+        return len(cfg.get('table_entries', []))
+
+    def read_table(self, sw_name):
+        if sw_name not in self.programmed:
+            raise ValueError(f"{sw_name!r} has not been programmed by this daemon")
+        sw, p4info_helper = self.programmed[sw_name]
+        try:
+            return controller.format_table_rules(p4info_helper, sw)
+        except grpc.RpcError:
+            self.drop(sw_name)
+            raise
+
+    def drop(self, sw_name):
+        """
+        Forget the connection of sw_name after a failed RPC; the next push reconnects.
+        """
+        addr, dev_id = self.switches[sw_name]
+        self.programmed.pop(sw_name, None)
+        controller.drop_switch_connection(addr, dev_id)
+
+
+def main():
+    controller.check_protobuf_backend()
+    path = controller.DAEMON_SOCKET
+    # a second daemon would take the socket over and contend for mastership
+    if controller.daemon_running(path):
+        print(f"[!] A controller daemon is already listening on {path}")
+        sys.exit(1)
+    # a socket left behind by a dead daemon would make bind() fail
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    # bound before connecting to the switches, so a daemon started meanwhile
+    # sees this one; created owner-only, with no window where others can connect
+    old_umask = os.umask(0o177)
+    try:
+        server = UnixXMLRPCServer(path)
+    finally:
+        os.umask(old_umask)
+
+    service = ControllerService()
+    try:
+        with server:
+            service.connect_all()
+            server.register_function(service.push_config, 'push_config')
+            server.register_function(service.read_table, 'read_table')
+            print(f"[+] Controller daemon listening on {path}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        print("[!] Interrupted by user")
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        print("[+] Shutting down connections (global)...")
+        controller.ShutdownAllSwitchConnections()
+        print("[+] Shutdown complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,26 +20,56 @@ import os
 import sys
 import time
 import json
+import functools
 import grpc
-from time import sleep
-import hashlib
+import io
+import itertools
+import logging
+import select
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
+
+try:
+    import orjson    # optional, faster JSON parsing
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # decode JSONB columns (tag_table.match) with orjson as well
+    psycopg2.extras.register_default_jsonb(loads=orjson.loads, globally=True)
 
 # helper path used by the tutorials repo
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                              '../../utils/'))
 import p4runtime_lib.bmv2
 import p4runtime_lib.helper
+from p4runtime_lib.convert import encode
 from p4runtime_lib.error_utils import printGrpcError
-from p4runtime_lib.switch import ShutdownAllSwitchConnections
+from p4runtime_lib.switch import GrpcRequestLogger, IterableQueue, connections
 
+from p4.config.v1 import p4info_pb2
 from p4.v1 import p4runtime_pb2
+from p4.v1 import p4runtime_pb2_grpc
+
+logger = logging.getLogger("p4ctl")
 
 # --- Adjust these to suit your layout ---
 CONFIG_DIR = "configs"   # per-switch JSON files live here: e.g. configs/s11-config.json
+P4INFO_BIN_SUFFIX = ".bin"   # binary P4Info cached next to the text file; see parse_p4info()
 POLL_INTERVAL = 10
+# seconds between rule counter reports (read in the background, off the watch loop)
+COUNTER_INTERVAL = 60
+# P4CTL_DUMP=1 prints every switch's table entries after initial programming
+DUMP_TABLES = os.environ.get("P4CTL_DUMP") == "1"
+# NOTIFY channels fed by the triggers in dbdata/notify_triggers.sql
+NOTIFY_CHANNELS = ("tag_change", "filter_change")
+NOTIFY_TRIGGERS = ("tag_table_notify", "filter_table_notify")
 
 TAG_SWITCH = {
     "s21": ("127.0.0.1:50055", 4),
@@ -58,83 +88,522 @@ FILTER_SWITCH = {
 DEFAULT_P4INFO = "build/basic.p4.p4info.txtpb"
 DEFAULT_BMV2_JSON = "build/basic.json"
 
+# gRPC channel tuning. The mastership StreamChannel is always open, so keepalive
+# pings go out even when no rule changes; a gRPC server with default settings
+# (BMv2 included) accepts one ping per 5 min without data and answers more
+# frequent ones with GOAWAY "too_many_pings", which would drop mastership.
+# A dead switch is noticed through GRPC_RPC_TIMEOUT instead.
+GRPC_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 5 * 60 * 1000),
+    ('grpc.keepalive_timeout_ms', 20000),
+    # batched WriteRequests / full-table reads can exceed the 4 MiB default
+    ('grpc.max_send_message_length', 64 << 20),
+    ('grpc.max_receive_message_length', 64 << 20),
+]
+# number of gRPC channels (TCP connections) per switch, the mastership stream's
+# included; from two on, Write/Read calls never share the stream's connection
+GRPC_CHANNEL_POOL_SIZE = 2
+# seconds a Write/Read may take before the switch is treated as unreachable
+GRPC_RPC_TIMEOUT = 30
+# seconds to wait for a switch channel to connect before giving up on the switch
+GRPC_READY_TIMEOUT = 5
+# seconds to wait for all switch connections to close on exit
+SHUTDOWN_TIMEOUT = 2
+# bound of the built-entry and encoded-value caches; DB rules change while the
+# controller runs, so the oldest items are evicted past this size
+ENTRY_CACHE_SIZE = 4096
+
 DB_HOST = "127.0.0.1"
 DB_PORT = 5432
 DB_USER = "p4"
 DB_PASSWORD = "p4pass"
 DB_NAME = "p4controller"
+DB_POOL_MINCONN = 2
+DB_POOL_MAXCONN = 16
 
 
 # ---------------- DB operation --------------------
 
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+# schema the rule queries rely on, applied at startup only where missing, each
+# statement committed on its own:
+# trigger-maintained updated_at columns used as change fingerprint (see dbdata/updated_at.sql),
+# run only when has_updated_at() finds them missing
+UPDATED_AT_SCHEMA = (
+    "ALTER TABLE tag_table ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "ALTER TABLE filter_table ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$ "
+    "BEGIN NEW.updated_at = clock_timestamp(); RETURN NEW; END; $$ LANGUAGE plpgsql",
+    "CREATE OR REPLACE TRIGGER tag_table_updated_at BEFORE INSERT OR UPDATE ON tag_table "
+    "FOR EACH ROW EXECUTE FUNCTION set_updated_at()",
+    "CREATE OR REPLACE TRIGGER filter_table_updated_at BEFORE INSERT OR UPDATE ON filter_table "
+    "FOR EACH ROW EXECUTE FUNCTION set_updated_at()",
+)
+# (index name, CREATE statement): covering indexes for the per-switch, id-ordered rule
+# queries (see dbdata/switch_id_indexes.sql) and the updated_at fingerprint indexes,
+# created only when pg_indexes does not list them
+DB_INDEXES = (
+    ("idx_tag_table_switch_id",
+     "CREATE INDEX IF NOT EXISTS idx_tag_table_switch_id ON tag_table(switch_name, id) INCLUDE (match, tag_value)"),
+    ("idx_filter_table_switch_id",
+     "CREATE INDEX IF NOT EXISTS idx_filter_table_switch_id ON filter_table(switch_name, id) INCLUDE (tag_value)"),
+    ("idx_tag_table_switch_updated",
+     "CREATE INDEX IF NOT EXISTS idx_tag_table_switch_updated ON tag_table(switch_name, updated_at DESC)"),
+    ("idx_filter_table_switch_updated",
+     "CREATE INDEX IF NOT EXISTS idx_filter_table_switch_updated ON filter_table(switch_name, updated_at DESC)"),
+)
+
+# statements of the poll hot path, prepared once per pooled connection ($1: text[] of switch names)
+# as (name, PREPARE statement) pairs
+PREPARED_STATEMENTS = (
+    ("fetch_all_rules",
+     "PREPARE fetch_all_rules(text[]) AS "
+     "SELECT 'tag' AS kind, switch_name, id, match, tag_value FROM tag_table WHERE switch_name = ANY($1) "
+     "UNION ALL "
+     "SELECT 'filter' AS kind, switch_name, id, NULL::jsonb, tag_value FROM filter_table WHERE switch_name = ANY($1) "
+     "ORDER BY kind, id"),
+    ("compute_all_db_hashes",
+     "PREPARE compute_all_db_hashes(text[]) AS "
+     "SELECT 'tag', switch_name, count(*), max(updated_at) "
+     "FROM tag_table WHERE switch_name = ANY($1) GROUP BY switch_name "
+     "UNION ALL "
+     "SELECT 'filter', switch_name, count(*), max(updated_at) "
+     "FROM filter_table WHERE switch_name = ANY($1) GROUP BY switch_name"),
+)
+# fingerprint used when the updated_at columns/triggers are missing (e.g. the
+# DB user may not ALTER the tables): a hash over the rule rows themselves
+CONTENT_FINGERPRINT_STATEMENT = (
+    "compute_all_db_hashes",
+    "PREPARE compute_all_db_hashes(text[]) AS "
+    "SELECT 'tag', switch_name, count(*), "
+    "md5(string_agg(format('%s:%s:%s', id, coalesce(match::text, ''), tag_value), '|' ORDER BY id)) "
+    "FROM tag_table WHERE switch_name = ANY($1) GROUP BY switch_name "
+    "UNION ALL "
+    "SELECT 'filter', switch_name, count(*), "
+    "md5(string_agg(format('%s:%s', id, tag_value), '|' ORDER BY id)) "
+    "FROM filter_table WHERE switch_name = ANY($1) GROUP BY switch_name",
+)
+UPDATED_AT_TRIGGERS = ("tag_table_updated_at", "filter_table_updated_at")
+# statements actually prepared, chosen by get_db_pool() once the schema is known
+_prepared_statements = PREPARED_STATEMENTS
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection that remembers which PREPARED_STATEMENTS were
+    prepared in its session (used as the pool's connection_factory).
+    """
+    prepared = frozenset()
+
+
+def ensure_prepared(conn):
+    """
+    Prepare the statements (PREPARED_STATEMENTS, see get_db_pool) missing on conn, so the poll queries are
+    parsed and planned once per connection instead of on every call.
+    Each statement is recorded as soon as it is prepared, so a retry never
+    re-prepares one that already exists in the session. If a statement cannot
+    be prepared, the connection is closed, so the pool discards it instead of
+    handing out a half-prepared session.
+
+    :param conn: PreparedConnection
+    """
+    if len(conn.prepared) == len(_prepared_statements):
+        return
+    try:
+        with conn.cursor() as cur:
+            for name, sql in _prepared_statements:
+                if name not in conn.prepared:
+                    cur.execute(sql)
+                    conn.prepared = conn.prepared | {name}
+    except psycopg2.Error:
+        conn.close()
+        raise
+
+
+def ensure_db_schema(conn):
+    """
+    Apply the parts of the schema that are missing: UPDATED_AT_SCHEMA unless
+    has_updated_at(conn), then the DB_INDEXES not listed in pg_indexes.
+    Once everything exists nothing is executed, so no table lock is taken.
+    Failures, e.g. missing privileges, are reported but not fatal.
+
+    :param conn: psycopg2 connection
+    """
+    statements = [] if has_updated_at(conn) else list(UPDATED_AT_SCHEMA)
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)",
+                        ([name for name, _ in DB_INDEXES],))
+            existing = {row[0] for row in cur}
+    statements += [sql for name, sql in DB_INDEXES if name not in existing]
+    for sql in statements:
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+        except psycopg2.Error as e:
+            logger.warning("[!] Could not update DB schema: %s", e)
+
+
+def has_updated_at(conn):
+    """
+    :param conn: psycopg2 connection
+    :return: True if both rule tables have the updated_at column and its trigger
+    """
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM information_schema.columns "
+                        "WHERE table_name IN ('tag_table', 'filter_table') AND column_name = 'updated_at'")
+            columns = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM pg_trigger WHERE tgname = ANY(%s) AND NOT tgisinternal",
+                        (list(UPDATED_AT_TRIGGERS),))
+            triggers = cur.fetchone()[0]
+    return columns == 2 and triggers == len(UPDATED_AT_TRIGGERS)
+
+
+def get_db_pool():
+    """
+    Create the shared connection pool on first use (throws if the DB is unreachable).
+
+    :return: psycopg2.pool.ThreadedConnectionPool
+    """
+    global _db_pool, _prepared_statements
+    with _db_pool_lock:
+        if _db_pool is None:
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                DB_POOL_MINCONN, DB_POOL_MAXCONN, connection_factory=PreparedConnection,
+                host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+            # first successful connect: make sure the schema the queries rely on exists
+            conn = pool.getconn()
+            try:
+                ensure_db_schema(conn)
+                if has_updated_at(conn):
+                    _prepared_statements = PREPARED_STATEMENTS
+                else:
+                    # fetch_all_rules does not need updated_at; only change detection falls back
+                    logger.warning("[!] tag_table/filter_table have no updated_at column or trigger "
+                                   "(run dbdata/updated_at.sql); detecting rule changes by content hash")
+                    _prepared_statements = PREPARED_STATEMENTS[:1] + (CONTENT_FINGERPRINT_STATEMENT,)
+            finally:
+                pool.putconn(conn, close=bool(conn.closed))
+            _db_pool = pool
+        return _db_pool
+
+
 def get_db_conn():
     """
-    :return: new psycopg2 connection (throws on error).
+    Take a connection from the shared pool; hand it back with put_db_conn().
+
+    :return: psycopg2 connection (throws on error).
     """
-    return psycopg2.connect(host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+    return get_db_pool().getconn()
 
 
-def fetch_tag_rules(conn, switch_name):
+def put_db_conn(conn):
     """
+    Return a connection taken with get_db_conn() to the pool.
+    Broken connections are discarded instead of being reused.
+
     :param conn: psycopg2 connection
-    :param switch_name: the switch name
-    :return: list of dicts: { 'id': int, 'match': <dict_or_none>, 'tag_value': int }
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute("SELECT id, match, tag_value FROM tag_table WHERE switch_name=%s ORDER BY id", (switch_name,))
-        return cur.fetchall()
+    get_db_pool().putconn(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def db_connection(autocommit=True):
+    """
+    Borrow a connection from the pool for the duration of a with-block.
+    Broken connections are discarded instead of being returned to the pool.
+
+    The controller only reads rules, so connections run in autocommit mode by
+    default: no implicit BEGIN/COMMIT around every SELECT. Pass autocommit=False
+    for writes that should be committed as one transaction (see db_insert_many).
+    """
+    conn = get_db_conn()
+    try:
+        if conn.autocommit != autocommit:
+            conn.autocommit = autocommit
+        yield conn
+    finally:
+        put_db_conn(conn)
+
+
+def close_db_pool():
+    """
+    Close every pooled connection (no-op if the pool was never created).
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+
+def open_listen_conn():
+    """
+    Open a dedicated connection that LISTENs on NOTIFY_CHANNELS, or return None
+    if the notify triggers are not installed (the caller then polls fingerprints).
+    The connection is kept out of the pool: LISTEN state belongs to the session.
+
+    :return: psycopg2 connection or None (throws on DB error)
+    """
+    conn = psycopg2.connect(host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_trigger WHERE tgname = ANY(%s) AND NOT tgisinternal",
+                    (list(NOTIFY_TRIGGERS),))
+        if cur.fetchone()[0] != len(NOTIFY_TRIGGERS):
+            conn.close()
+            return None
+        for channel in NOTIFY_CHANNELS:
+            cur.execute(f"LISTEN {channel}")
+    return conn
+
+
+def wait_for_changes(listen_conn, timeout):
+    """
+    Block until a rule-change notification arrives or timeout seconds pass.
+
+    :param listen_conn: connection from open_listen_conn
+    :param timeout: seconds to wait
+    :return: set of switch names whose rules changed (empty on timeout)
+    """
+    changed = set()
+    if select.select([listen_conn], [], [], timeout)[0]:
+        listen_conn.poll()
+        while listen_conn.notifies:
+            changed.add(listen_conn.notifies.pop(0).payload)
+    return changed
+
+
+def db_insert_many(conn, sql, rows, page_size=1000):
+    """
+    Run an INSERT/UPDATE statement for many rows with psycopg2.extras.execute_batch,
+    which sends page_size statements per round trip instead of one per row.
+    Use this for any bulk write-back (counter dumps, read-back logs, audit rows),
+    on a connection borrowed with db_connection(autocommit=False).
+
+    :param conn: psycopg2 connection
+    :param sql: statement with %s placeholders, e.g. "INSERT INTO t (a, b) VALUES (%s, %s)"
+    :param rows: iterable of parameter tuples
+    :param page_size: number of statements per round trip
+    """
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_batch(cur, sql, rows, page_size=page_size)
+    conn.commit()
+
+
+def fetch_all_rules(conn, switch_names):
+    """
+    Fetch the tag and filter rules of several switches in one round trip
+    (UNION ALL over both tables, switch_name = ANY(...); see PREPARED_STATEMENTS).
+
+    :param conn: psycopg2 connection
+    :param switch_names: iterable of switch names
+    :return: dict switch_name -> (tag_rows, filter_rows) with an entry for every requested switch
+             tag_rows: list of tuples: (id, match <dict_or_none>, tag_value)
+             filter_rows: list of tuples: (id, None, tag_value)
+    """
+    switch_names = list(switch_names)
+    rules = {name: ([], []) for name in switch_names}
+    ensure_prepared(conn)
+    with conn.cursor() as cur:
+        cur.execute("EXECUTE fetch_all_rules(%s::text[])", (switch_names,))
+        for (kind, sw_name, row_id, match, tag_value) in cur:
+            tag_rows, filter_rows = rules[sw_name]
+            (tag_rows if kind == 'tag' else filter_rows).append((row_id, match, tag_value))
+    return rules
 
 
-def fetch_filter_rules(conn, switch_name):
+def fetch_rules(conn, switch_name):
     """
+    Fetch the tag and filter rules of one switch in one round trip.
+
     :param conn: psycopg2 connection
     :param switch_name: the switch name
-    :return: list of dicts: { 'id': int, 'tag_value': int }
+    :return: (tag_rows, filter_rows), see fetch_all_rules
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute("SELECT id, tag_value FROM filter_table WHERE switch_name=%s ORDER BY id", (switch_name,))
-        return cur.fetchall()
+    return fetch_all_rules(conn, [switch_name])[switch_name]
 
 
-def compute_db_hash(conn, switch_name):
+def compute_all_db_hashes(conn, switch_names):
     """
-    Compute an md5 fingerprint based on tag_table and filter_table rows for the switch.
+    Compute a fingerprint of the tag_table and filter_table rows of several
+    switches in one round trip: per table, the row count and the latest
+    updated_at (set by trigger on every insert/update, see UPDATED_AT_SCHEMA), answered
+    from the (switch_name, updated_at) indexes without reading the rule rows.
+    An insert or update moves max(updated_at), a delete lowers the count.
+    On a database without the updated_at columns/triggers, the second value is
+    an md5 over the rows instead (CONTENT_FINGERPRINT_STATEMENT).
     If DB error occurs, raises exception.
 
     :param conn: psycopg2 connection
-    :param switch_name: the switch name
-    :return: md5 hex digest string
+    :param switch_names: iterable of switch names
+    :return: dict switch_name -> ((tag_count, tag_updated_at), (filter_count, filter_updated_at)),
+             for every requested switch; compare fingerprints only for equality
     """
-    parts = []
+    switch_names = list(switch_names)
+    digests = {name: {'tag': (0, None), 'filter': (0, None)} for name in switch_names}
+    ensure_prepared(conn)
     with conn.cursor() as cur:
-        # tag_table rows
-        cur.execute("SELECT id, match::text, tag_value FROM tag_table WHERE switch_name=%s ORDER BY id", (switch_name,))
-        for r in cur.fetchall():
-            # r = (id, match_text, tag_value)
-            parts.append(f"TAG:{r[0]}:{r[1] or ''}:{r[2]}")
+        cur.execute("EXECUTE compute_all_db_hashes(%s::text[])", (switch_names,))
+        for (kind, sw_name, count, updated_at) in cur:
+            digests[sw_name][kind] = (count, updated_at)
 
-        # filter_table rows
-        cur.execute("SELECT id, tag_value FROM filter_table WHERE switch_name=%s ORDER BY id", (switch_name,))
-        for r in cur.fetchall():
-            parts.append(f"FILT:{r[0]}:{r[1]}")
+    return {name: (d['tag'], d['filter']) for name, d in digests.items()}
+
+
+def compute_db_hash(conn, switch_name):
+    """
+    Compute the fingerprint of one switch, see compute_all_db_hashes.
 
-    combined = "|".join(parts)
-    return hashlib.md5(combined.encode()).hexdigest()
+    :param conn: psycopg2 connection
+    :param switch_name: the switch name
+    :return: ((tag_count, tag_updated_at), (filter_count, filter_updated_at))
+    """
+    return compute_all_db_hashes(conn, [switch_name])[switch_name]
 
 
 # ---------------- helper utilities ----------------
+def json_loads(data):
+    """
+    Parse JSON bytes with orjson when installed, else the stdlib json module.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# file name -> path of CONFIG_DIR, filled by one os.scandir on first use
+_CONFIG_INDEX = None
+
+
+def config_index():
+    """
+    :return: dict mapping file names in CONFIG_DIR to their paths
+    """
+    global _CONFIG_INDEX
+    if _CONFIG_INDEX is None:
+        try:
+            with os.scandir(CONFIG_DIR) as it:
+                _CONFIG_INDEX = {entry.name: entry.path for entry in it if entry.is_file()}
+        except FileNotFoundError:
+            _CONFIG_INDEX = {}
+    return _CONFIG_INDEX
+
+
+@functools.lru_cache(maxsize=None)
 def load_switch_config(sw_name):
     """
     Load <CONFIG_DIR>/<sw_name>-config.json if present.
+    The parsed config is cached per switch; callers must not modify it.
 
     :param sw_name: the switch name
     :return: dict or None
     """
-    path = os.path.join(CONFIG_DIR, f"{sw_name}-config.json")
-    if not os.path.exists(path):
+    path = config_index().get(f"{sw_name}-config.json")
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
         return None
-    with open(path, 'r') as f:
-        return json.load(f)
+
+
+def cache_p4info_lookups(p4info_helper):
+    """
+    Memoize the name <-> id P4Info lookups that build_table_entry,
+    delete_all_db_managed_entries, read_table_rules and read_counters repeat for
+    every entry. P4InfoHelper resolves names and ids by scanning the P4Info lists,
+    and the DB rules of a switch all share the same few tables, actions and fields.
+    The helper is read-only after loading, so the cached results never go stale.
+
+    :param p4info_helper: the P4Info helper
+    :return: the same helper with cached lookups
+    """
+    for attr in ('get_tables_id', 'get_actions_id', 'get_match_field', 'get_action_param',
+                 'get_tables_name', 'get_actions_name', 'get_match_field_name',
+                 'get_action_param_name', 'get_counters_id'):
+        setattr(p4info_helper, attr, functools.lru_cache(maxsize=None)(getattr(p4info_helper, attr)))
+    return p4info_helper
+
+
+def parse_p4info(p4info_path):
+    """
+    Build a P4InfoHelper for p4info_path, parsing the text format only once.
+    The parsed P4Info is kept next to the file as binary protobuf
+    (<p4info_path>.bin) and reused while it is not older than the text file.
+
+    :param p4info_path: path to the P4Info text file
+    :return: the P4Info helper
+    """
+    bin_path = p4info_path + P4INFO_BIN_SUFFIX
+    try:
+        if os.stat(bin_path).st_mtime >= os.stat(p4info_path).st_mtime:
+            p4info = p4info_pb2.P4Info()
+            with open(bin_path, 'rb') as f:
+                p4info.ParseFromString(f.read())
+            # P4InfoHelper.__init__ only parses the file into self.p4info
+            helper = p4runtime_lib.helper.P4InfoHelper.__new__(p4runtime_lib.helper.P4InfoHelper)
+            helper.p4info = p4info
+            return helper
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("    ! Ignoring unreadable P4Info cache %s: %s", bin_path, e)
+
+    helper = p4runtime_lib.helper.P4InfoHelper(p4info_path)
+    # write to a temp file first so concurrent readers never see a partial cache
+    tmp_path = f"{bin_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(helper.p4info.SerializeToString())
+        os.replace(tmp_path, bin_path)
+    except OSError as e:
+        logger.warning("    ! Could not write P4Info cache %s: %s", bin_path, e)
+    return helper
+
+
+@functools.lru_cache(maxsize=None)
+def load_p4info(p4info_path):
+    """
+    Parse p4info_path once and share the helper between every switch that uses it.
+    The helper is read-only after loading, so worker threads can share it.
+
+    :param p4info_path: path to the P4Info text file
+    :return: the P4Info helper
+    """
+    return cache_p4info_lookups(parse_p4info(p4info_path))
+
+
+# suffix of config keys whose value is pre-packed hex (written by genconfig.py)
+HEX_SUFFIX = "_hex"
+
+
+def unhex_fields(fields):
+    """
+    Decode pre-packed fields: a "<name>_hex" key becomes "<name>" and its hex
+    string (or the first element of a [value, prefix_len] list) becomes bytes,
+    which encode_value passes through without parsing. Other keys are unchanged.
+
+    :param fields: match or action_params dict from a JSON entry
+    :return: dict with decoded fields
+    """
+    if not any(k.endswith(HEX_SUFFIX) for k in fields):
+        return fields
+    out = {}
+    for k, v in fields.items():
+        if k.endswith(HEX_SUFFIX):
+            k = k[:-len(HEX_SUFFIX)]
+            if isinstance(v, (list, tuple)):
+                v = [bytes.fromhex(v[0])] + list(v[1:])
+            else:
+                v = bytes.fromhex(v)
+        out[k] = v
+    return out
 
 
 def normalize_match_value(raw):
@@ -144,24 +613,117 @@ def normalize_match_value(raw):
     :param raw: raw match value from JSON
     :return: normalized value
     """
-    if raw is None:
-        return None
-    # if already list/tuple convert to tuple
-    if isinstance(raw, (list, tuple)):
+    # exact type checks: JSON only yields plain list/str/int, and the common
+    # [value, prefix_len] case is handled first without a generic tuple() copy
+    t = type(raw)
+    if t is list:
+        if len(raw) == 2:
+            return (raw[0], raw[1])
         if len(raw) == 1:
             return (raw[0],)
         return tuple(raw)
+    # already normalized: reuse the tuple as-is
+    if t is tuple:
+        return raw
     # if it's a string or number, coerce into a one- or two-element tuple
-    if isinstance(raw, str):
+    if t is str:
         return (raw,)
-    if isinstance(raw, int):
+    if t is int:
         return (raw, 0)
+    # None and unknown shapes pass through
     return raw
 
 
+@functools.lru_cache(maxsize=ENTRY_CACHE_SIZE)
+def encode_value(value, bitwidth):
+    """
+    Encode a match/param value into bytes, once per distinct (value, bitwidth).
+
+    :param value: bytes, str (IPv4/MAC), int or a one-element tuple
+    :param bitwidth: bit width of the field
+    :return: encoded bytes
+    """
+    if isinstance(value, bytes):
+        return value
+    return encode(value, bitwidth)
+
+
+def build_table_entry(p4info_helper, table_name, match_fields=None, default_action=False,
+                      action_name=None, action_params=None, priority=None):
+    """
+    Build a p4runtime TableEntry like P4InfoHelper.buildTableEntry, but directly
+    from the memoized id lookups and encoded values.
+
+    :param p4info_helper: the P4Info helper (see cache_p4info_lookups)
+    :return: p4runtime_pb2.TableEntry
+    """
+    table_entry = p4runtime_pb2.TableEntry()
+    table_entry.table_id = p4info_helper.get_tables_id(table_name)
+    if priority is not None:
+        table_entry.priority = priority
+
+    if match_fields:
+        for field_name, value in match_fields.items():
+            p4info_match = p4info_helper.get_match_field(table_name, field_name)
+            bitwidth = p4info_match.bitwidth
+            field_match = table_entry.match.add()
+            field_match.field_id = p4info_match.id
+            match_type = p4info_match.match_type
+            if match_type == p4info_pb2.MatchField.EXACT:
+                field_match.exact.value = encode_value(value, bitwidth)
+            elif match_type == p4info_pb2.MatchField.LPM:
+                field_match.lpm.value = encode_value(value[0], bitwidth)
+                field_match.lpm.prefix_len = value[1]
+            elif match_type == p4info_pb2.MatchField.TERNARY:
+                field_match.ternary.value = encode_value(value[0], bitwidth)
+                field_match.ternary.mask = encode_value(value[1], bitwidth)
+            elif match_type == p4info_pb2.MatchField.RANGE:
+                field_match.range.low = encode_value(value[0], bitwidth)
+                field_match.range.high = encode_value(value[1], bitwidth)
+            else:
+                raise ValueError(f"unsupported match type {match_type} for {table_name}.{field_name}")
+
+    if default_action:
+        table_entry.is_default_action = True
+
+    if action_name:
+        action = table_entry.action.action
+        action.action_id = p4info_helper.get_actions_id(action_name)
+        if action_params:
+            for param_name, value in action_params.items():
+                p4info_param = p4info_helper.get_action_param(action_name, param_name)
+                param = action.params.add()
+                param.param_id = p4info_param.id
+                param.value = encode_value(value, p4info_param.bitwidth)
+    return table_entry
+
+
+# built TableEntry protos keyed by (p4info_helper, table, match, action, params);
+# switches sharing a ruleset reuse one build and only pay for a CopyFrom.
+# Bounded: DB rules change over the controller's lifetime, so the oldest
+# builds are evicted once ENTRY_CACHE_SIZE entries are cached.
+_ENTRY_CACHE = {}
+_ENTRY_CACHE_LOCK = threading.Lock()
+
+
+def _entry_cache_key(p4info_helper, table_name, default_action, match_fields, action_name, action_params):
+    """
+    :return: hashable key describing a table entry, or None if a value is unhashable
+    """
+    key = (p4info_helper, table_name, default_action,
+           frozenset(match_fields.items()), action_name,
+           frozenset(action_params.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def build_entry_from_json(p4info_helper, entry_obj):
     """
-    Convert a JSON description into a p4runtime table entry (using p4info_helper.buildTableEntry).
+    Convert a JSON description into a p4runtime table entry (using build_table_entry).
+    Identical descriptions are built once; later calls return a copy of the cached entry.
 
     :param p4info_helper: the P4Info helper
     :param entry_obj: JSON-like dict describing the table entry
@@ -171,35 +733,113 @@ def build_entry_from_json(p4info_helper, entry_obj):
         raise ValueError("table entry missing 'table' field")
 
     table_name = entry_obj['table']
+    default_action = bool(entry_obj.get('default_action', False))
 
-    # default action case
-    if entry_obj.get('default_action', False):
-        action_name = entry_obj.get('action_name')
-        action_params = entry_obj.get('action_params', {}) or {}
-        entry = p4info_helper.buildTableEntry(
+    # default action case has no match fields
+    match_fields = {}
+    if not default_action and 'match' in entry_obj and isinstance(entry_obj['match'], dict):
+        for k, v in unhex_fields(entry_obj['match']).items():
+            match_fields[k] = normalize_match_value(v)
+
+    action_name = entry_obj.get('action_name')
+    action_params = unhex_fields(entry_obj.get('action_params', {}) or {})
+
+    key = _entry_cache_key(p4info_helper, table_name, default_action,
+                           match_fields, action_name, action_params)
+    cached = _ENTRY_CACHE.get(key) if key is not None else None
+    if cached is None:
+        cached = build_table_entry(
+            p4info_helper,
             table_name=table_name,
-            default_action=True,
+            match_fields=match_fields,
+            default_action=default_action,
             action_name=action_name,
             action_params=action_params
         )
-        return table_name, entry
+        if key is not None:
+            with _ENTRY_CACHE_LOCK:
+                if len(_ENTRY_CACHE) >= ENTRY_CACHE_SIZE:
+                    del _ENTRY_CACHE[next(iter(_ENTRY_CACHE))]
+                _ENTRY_CACHE[key] = cached
+
+    table_entry = p4runtime_pb2.TableEntry()
+    table_entry.CopyFrom(cached)
+    return table_name, table_entry
 
-    # normal entry with match fields
-    match_fields = {}
-    if 'match' in entry_obj and isinstance(entry_obj['match'], dict):
-        for k, v in entry_obj['match'].items():
-            match_fields[k] = normalize_match_value(v)
 
-    action_name = entry_obj.get('action_name')
-    action_params = entry_obj.get('action_params', {}) or {}
-
-    table_entry = p4info_helper.buildTableEntry(
-        table_name=table_name,
-        match_fields=match_fields,
-        action_name=action_name,
-        action_params=action_params
-    )
-    return table_name, table_entry
+# ---------------- switch connection ----------------
+class TunedBmv2SwitchConnection(p4runtime_lib.bmv2.Bmv2SwitchConnection):
+    """
+    Bmv2SwitchConnection whose gRPC channels are created with channel options.
+    SwitchConnection.__init__ opens its channel without options, so this
+    mirrors that constructor and only changes how the channels are built.
+
+    Besides the primary channel (which carries the StreamChannel used for
+    mastership), a small pool of extra channels is opened so that Write/Read
+    calls are spread round-robin over separate TCP connections.
+    """
+
+    def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
+                 proto_dump_file=None, channel_options=GRPC_CHANNEL_OPTIONS,
+                 pool_size=GRPC_CHANNEL_POOL_SIZE):
+        self.name = name
+        self.address = address
+        self.device_id = device_id
+        self.p4info = None
+        self._channels = []
+        self._stubs = []
+        for i in range(max(1, pool_size)):
+            # a distinct channel arg keeps gRPC from sharing one subchannel
+            channel = grpc.insecure_channel(self.address, options=channel_options + [('p4ctl.channel_index', i)])
+            if proto_dump_file is not None:
+                interceptor = GrpcRequestLogger(proto_dump_file)
+                channel = grpc.intercept_channel(channel, interceptor)
+            self._channels.append(channel)
+            self._stubs.append(p4runtime_pb2_grpc.P4RuntimeStub(channel))
+        self._rr = itertools.count()
+        self.channel = self._channels[0]
+        self.client_stub = self._stubs[0]
+        self.requests_stream = IterableQueue()
+        self.stream_msg_resp = self.client_stub.StreamChannel(iter(self.requests_stream))
+        self.proto_dump_file = proto_dump_file
+        # device_id / election_id header shared by every WriteRequest to this switch
+        self._write_template = p4runtime_pb2.WriteRequest(device_id=device_id)
+        self._write_template.election_id.low = 1
+        connections.append(self)
+
+    def new_write_request(self):
+        """
+        :return: empty WriteRequest with this switch's device_id and election_id set
+        """
+        request = p4runtime_pb2.WriteRequest()
+        request.CopyFrom(self._write_template)
+        return request
+
+    def next_stub(self):
+        """
+        :return: the next P4Runtime stub of the channel pool (round-robin); the
+                 first channel carries the mastership StreamChannel and is only
+                 used when there is no other
+        """
+        if len(self._stubs) == 1:
+            return self._stubs[0]
+        return self._stubs[1 + next(self._rr) % (len(self._stubs) - 1)]
+
+    def ReadTableEntries(self, table_id=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        entity.table_entry.table_id = table_id if table_id is not None else 0
+        if dry_run:
+            logger.info("P4Runtime Read: %s", request)
+        else:
+            for response in self.next_stub().Read(request, timeout=GRPC_RPC_TIMEOUT):
+                yield response
+
+    def shutdown(self):
+        super().shutdown()
+        for channel in self._channels:
+            channel.close()
 
 
 # ---------------- core programming functions ----------------
@@ -212,42 +852,106 @@ def set_pipeline(p4info_helper, sw, bmv2_json_path):
     :param bmv2_json_path: path to the BMv2 JSON file
     """
     try:
-        print(f"    -> Installing pipeline (JSON: {bmv2_json_path}) on {sw.name}")
+        logger.info("    -> Installing pipeline (JSON: %s) on %s", bmv2_json_path, sw.name)
         sw.SetForwardingPipelineConfig(
             p4info=p4info_helper.p4info,
             bmv2_json_file_path=bmv2_json_path)
     except grpc.RpcError as e:
-        print(f"    ! SetForwardingPipelineConfig warning for {sw.name}: {getattr(e, 'code', lambda: '')()} {getattr(e, 'details', lambda: '')()}")
+        # the switch already runs a pipeline: keep going with it
+        if e.code() in (grpc.StatusCode.ALREADY_EXISTS, grpc.StatusCode.FAILED_PRECONDITION):
+            logger.warning("    ! SetForwardingPipelineConfig warning for %s: %s %s", sw.name, e.code(), e.details())
+        else:
+            raise
+
+
+def build_write_request(sw, tbl_entries):
+    """
+    Build one WriteRequest holding an update per (table_name, entry) tuple.
+    Default-action entries always exist on the switch, so they are MODIFY updates.
+
+    :param sw: the switch connection
+    :param tbl_entries: list of (table_name, entry) tuples
+    :return: p4runtime_pb2.WriteRequest
+    """
+    request = sw.new_write_request()
+    for (tname, entry) in tbl_entries:
+        update = request.updates.add()
+        if entry.is_default_action:
+            update.type = p4runtime_pb2.Update.MODIFY
+        else:
+            update.type = p4runtime_pb2.Update.INSERT
+        update.entity.table_entry.CopyFrom(entry)
+    return request
 
 
 def write_entries(sw, tbl_entries):
     """
     Write a list of (table_name, entry) tuples to switch sw.
 
+    All entries go out in a single WriteRequest (one gRPC round trip). If the batch
+    is rejected, the entries are retried one by one: entries that already exist
+    (ALREADY_EXISTS, e.g. applied before the batch failed) are skipped, any other
+    error is raised.
+
     :param tbl_entries: list of (table_name, entry) tuples
     :param sw: the switch connection
     """
+    if not tbl_entries:
+        return
+    try:
+        sw.next_stub().Write(build_write_request(sw, tbl_entries), timeout=GRPC_RPC_TIMEOUT)
+        logger.info("    -> Inserted %d entries on %s", len(tbl_entries), sw.name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("\n".join(f"      -> Inserted entry into table '{tname}' on {sw.name}"
+                                   for (tname, entry) in tbl_entries))
+        return
+    except grpc.RpcError as e:
+        logger.warning("    ! Batched write of %d entries failed on %s; retrying one by one", len(tbl_entries), sw.name)
+        printGrpcError(e)
+
     for (tname, entry) in tbl_entries:
         try:
-            sw.WriteTableEntry(entry)
-            print(f"    -> Inserted entry into table '{tname}' on {sw.name}")
-        except Exception as e:
-            print(f"    ! Failed to insert entry into '{tname}' on {sw.name}: {e}")
-            if isinstance(e, grpc.RpcError):
-                printGrpcError(e)
+            sw.next_stub().Write(build_write_request(sw, [(tname, entry)]), timeout=GRPC_RPC_TIMEOUT)
+            logger.debug("    -> Inserted entry into table '%s' on %s", tname, sw.name)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.ALREADY_EXISTS:
+                logger.debug("    -> Entry already present in table '%s' on %s", tname, sw.name)
+                continue
+            logger.warning("    ! Failed to insert entry into '%s' on %s: %s", tname, sw.name, e)
+            printGrpcError(e)
             raise
 
 
+def build_delete_request(sw, tbl_entries):
+    """
+    Build one WriteRequest holding a DELETE update per (table_name, entry) tuple.
+
+    :param sw: the switch connection
+    :param tbl_entries: list of (table_name, entry) tuples
+    :return: p4runtime_pb2.WriteRequest
+    """
+    request = sw.new_write_request()
+    for (tname, entry) in tbl_entries:
+        update = request.updates.add()
+        update.type = p4runtime_pb2.Update.DELETE
+        update.entity.table_entry.CopyFrom(entry)
+    return request
+
+
 def delete_all_db_managed_entries(p4info_helper, sw):
     """
     Read all table entries from the switch and delete entries that belong to
     MyEgress.set_dscp_tag or MyEgress.filter_dscp_tag.
 
+    The deletes go out in a single WriteRequest. If the batch is rejected, the
+    entries are retried one by one and failures are reported per entry.
+
     :param p4info_helper: the P4Info helper
     :param sw: the switch connection
     """
     tables_to_remove = {"MyEgress.set_dscp_tag", "MyEgress.filter_dscp_tag"}
-    print(f"    -> Deleting existing DB-managed entries on {sw.name} ...")
+    logger.info("    -> Deleting existing DB-managed entries on %s ...", sw.name)
+    tbl_entries = []
     try:
         for response in sw.ReadTableEntries():
             for entity in response.entities:
@@ -257,59 +961,138 @@ def delete_all_db_managed_entries(p4info_helper, sw):
                     table_name = p4info_helper.get_tables_name(entry.table_id)
                 except Exception:
                     table_name = None
-                # remove entries in table
+                # collect entries in table
                 if table_name in tables_to_remove:
-                    try:
-                        request = p4runtime_pb2.WriteRequest()
-                        request.device_id = sw.device_id
-                        request.election_id.low = 1
-                        update = request.updates.add()
-                        update.type = p4runtime_pb2.Update.DELETE
-                        update.entity.table_entry.CopyFrom(entry)
-                        sw.client_stub.Write(request)
-                        print(f"      -> Deleted entry from {table_name} on {sw.name}")
-                    except Exception as e:
-                        print(f"      ! Failed to delete entry from {table_name} on {sw.name}: {e}")
-                        if isinstance(e, grpc.RpcError):
-                            printGrpcError(e)
-
+                    tbl_entries.append((table_name, entry))
     except Exception as e:
-        print(f"    ! Error while reading table entries from {sw.name} for deletion: {e}")
+        logger.warning("    ! Error while reading table entries from %s for deletion: %s", sw.name, e)
         if isinstance(e, grpc.RpcError):
             printGrpcError(e)
 
+    if not tbl_entries:
+        return
+    try:
+        sw.next_stub().Write(build_delete_request(sw, tbl_entries), timeout=GRPC_RPC_TIMEOUT)
+        logger.info("      -> Deleted %d entries on %s", len(tbl_entries), sw.name)
+        return
+    except grpc.RpcError as e:
+        logger.warning("    ! Batched delete of %d entries failed on %s; retrying one by one", len(tbl_entries), sw.name)
+        printGrpcError(e)
+
+    for (table_name, entry) in tbl_entries:
+        try:
+            sw.next_stub().Write(build_delete_request(sw, [(table_name, entry)]), timeout=GRPC_RPC_TIMEOUT)
+            logger.debug("      -> Deleted entry from %s on %s", table_name, sw.name)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                continue
+            logger.warning("      ! Failed to delete entry from %s on %s: %s", table_name, sw.name, e)
+            printGrpcError(e)
+
 
-def program_db_rules(db_conn, p4info_helper, sw):
+def build_diff_requests(sw, old_built, new_built):
     """
-    Delete existing DB-managed entries on the switch.
-    Read tag_table and filter_table for switch sw_name and program corresponding
-    rules to the switch.
+    Build the WriteRequests that turn the DB-managed entries of old_built into
+    those of new_built (both ('tag'|'filter', row id) -> (row, (table_name, entry))):
+    INSERT for new rows, DELETE for removed rows, MODIFY for changed rows whose
+    match is unchanged, DELETE + INSERT for changed rows whose match changed.
+
+    Updates of one WriteRequest may be applied in any order, so when a deleted
+    and an inserted entry share the same match the deletes are sent first in a
+    separate request.
+
+    :param sw: the switch connection
+    :param old_built: entries currently on the switch
+    :param new_built: entries that should be on the switch
+    :return: list of p4runtime_pb2.WriteRequest (empty if nothing changed)
+    """
+    deletes, inserts, modifies = [], [], []
+    for key, (row, tbl_entry) in old_built.items():
+        if key not in new_built:
+            deletes.append(tbl_entry)
+    for key, (row, tbl_entry) in new_built.items():
+        old = old_built.get(key)
+        if old is None:
+            inserts.append(tbl_entry)
+        elif old[0] != row:
+            old_entry = old[1][1]
+            new_entry = tbl_entry[1]
+            if old_entry.table_id == new_entry.table_id and old_entry.match == new_entry.match:
+                modifies.append(tbl_entry)
+            else:
+                deletes.append(old[1])
+                inserts.append(tbl_entry)
+
+    def match_key(entry):
+        return (entry.table_id, tuple(m.SerializeToString() for m in entry.match))
+
+    updates = [(p4runtime_pb2.Update.DELETE, tbl_entry) for tbl_entry in deletes]
+    requests = []
+    if deletes and inserts and {match_key(e) for (_, e) in deletes} & {match_key(e) for (_, e) in inserts}:
+        requests.append(build_delete_request(sw, deletes))
+        updates = []
+    updates += [(p4runtime_pb2.Update.INSERT, tbl_entry) for tbl_entry in inserts]
+    updates += [(p4runtime_pb2.Update.MODIFY, tbl_entry) for tbl_entry in modifies]
+    if updates:
+        request = sw.new_write_request()
+        for (update_type, (tname, entry)) in updates:
+            update = request.updates.add()
+            update.type = update_type
+            update.entity.table_entry.CopyFrom(entry)
+        requests.append(request)
+    return requests
+
+
+def program_db_rules(db_conn, p4info_helper, sw, rules=None, entry_cache=None):
+    """
+    Read tag_table and filter_table for switch sw_name (unless already prefetched
+    in rules) and program corresponding rules to the switch.
 
     Tag rules use table MyEgress.set_dscp_tag with action MyEgress.modify_dscp(dscp_value).
     Filter rules use table MyEgress.filter_dscp_tag with action MyEgress.drop().
 
+    entry_cache keeps the entries built for this switch across calls, keyed by
+    ('tag'|'filter', row id) -> (row, (table_name, entry)); rows that did not
+    change since the last call reuse their entry instead of being rebuilt.
+    It is updated only after the entries were written.
+
+    When entry_cache holds the entries of the last successful call, only the
+    difference is written (see build_diff_requests). Otherwise, or if the diff
+    is rejected, all DB-managed entries are deleted on the switch and rewritten.
+
     :param db_conn: psycopg2 connection
     :param p4info_helper: the P4Info helper
     :param sw: the switch connection
+    :param rules: optional prefetched (tag_rows, filter_rows) from fetch_all_rules
+    :param entry_cache: optional per-switch dict, see above
     :return: list of rule IDs programmed
     """
-    if db_conn is None:
-        print(f"    -> No DB connection; skipping DB rules for {sw.name}")
+    if db_conn is None and rules is None:
+        logger.info("    -> No DB connection; skipping DB rules for %s", sw.name)
         return
 
-    delete_all_db_managed_entries(p4info_helper, sw)
-
     rule_list = []
     try:
+        # one query for both rule tables (skipped when prefetched)
+        if rules is None:
+            rules = fetch_rules(db_conn, sw.name)
+        tag_rows, filter_rows = rules
+        # tag and filter entries go out together in one WriteRequest
+        tbl_entries = []
+        built = {}
+        old_built = entry_cache if entry_cache is not None else {}
+
         # TAG rules
-        tag_rows = fetch_tag_rules(db_conn, sw.name)
         if tag_rows:
-            tbl_entries = []
-            for r in tag_rows:
-                match = r.get('match') or {}
-                tag_value = r.get('tag_value')
-                counter_index = r.get('id')
+            for row in tag_rows:
+                (counter_index, match, tag_value) = row
                 rule_list.append(counter_index)
+                cached = old_built.get(('tag', counter_index))
+                if cached is not None and cached[0] == row:
+                    built[('tag', counter_index)] = cached
+                    tbl_entries.append(cached[1])
+                    continue
+                match = match or {}
                 # build a JSON-like record compatible with build_entry_from_json
                 rec = {
                     'table': 'MyEgress.set_dscp_tag',
@@ -320,23 +1103,24 @@ def program_db_rules(db_conn, p4info_helper, sw):
                 try:
                     tname, tentry = build_entry_from_json(p4info_helper, rec)
                     tbl_entries.append((tname, tentry))
+                    built[('tag', counter_index)] = (row, (tname, tentry))
                 except Exception as ex:
-                    print(f"    ! Error building tag entry for {sw.name} row {r.get('id')}: {ex}")
+                    logger.warning("    ! Error building tag entry for %s row %s: %s", sw.name, counter_index, ex)
                     raise
-            if tbl_entries:
-                print(f"    -> Writing {len(tbl_entries)} tag entries (DB) to {sw.name}")
-                write_entries(sw, tbl_entries)
         else:
-            print(f"    -> No tag rules in DB for {sw.name}")
+            logger.info("    -> No tag rules in DB for %s", sw.name)
 
         # FILTER rules
-        filter_rows = fetch_filter_rules(db_conn, sw.name)
         if filter_rows:
-            tbl_entries = []
-            for r in filter_rows:
-                tag_value = r.get('tag_value')
-                counter_index = r.get('id')  # use rule ID as counter index
+            # use rule ID as counter index
+            for row in filter_rows:
+                (counter_index, _, tag_value) = row
                 rule_list.append(counter_index)
+                cached = old_built.get(('filter', counter_index))
+                if cached is not None and cached[0] == row:
+                    built[('filter', counter_index)] = cached
+                    tbl_entries.append(cached[1])
+                    continue
                 # match on hdr.ipv4.diffserv exact 8-bit match -> represent as [value, 8]
                 rec = {
                     'table': 'MyEgress.filter_dscp_tag',
@@ -347,19 +1131,42 @@ def program_db_rules(db_conn, p4info_helper, sw):
                 try:
                     tname, tentry = build_entry_from_json(p4info_helper, rec)
                     tbl_entries.append((tname, tentry))
+                    built[('filter', counter_index)] = (row, (tname, tentry))
                 except Exception as ex:
-                    print(f"    ! Error building filter entry for {sw.name} row {r.get('id')}: {ex}")
+                    logger.warning("    ! Error building filter entry for %s row %s: %s", sw.name, counter_index, ex)
                     raise
+        else:
+            logger.info("    -> No filter rules in DB for %s", sw.name)
+
+        full_rewrite = not old_built
+        if not full_rewrite:
+            try:
+                requests = build_diff_requests(sw, old_built, built)
+                logger.info("    -> Applying %d changed entries (DB) to %s", sum(len(req.updates) for req in requests), sw.name)
+                for request in requests:
+                    sw.next_stub().Write(request, timeout=GRPC_RPC_TIMEOUT)
+            except grpc.RpcError as e:
+                logger.warning("    ! Incremental update failed on %s; rewriting all DB rules", sw.name)
+                printGrpcError(e)
+                full_rewrite = True
+
+        if full_rewrite:
+            delete_all_db_managed_entries(p4info_helper, sw)
             if tbl_entries:
-                print(f"    -> Writing {len(tbl_entries)} filter entries (DB) to {sw.name}")
+                logger.info("    -> Writing %d tag and %d filter entries (DB) to %s", len(tag_rows), len(filter_rows), sw.name)
                 write_entries(sw, tbl_entries)
-        else:
-            print(f"    -> No filter rules in DB for {sw.name}")
+
+        if entry_cache is not None:
+            entry_cache.clear()
+            entry_cache.update(built)
 
     except Exception as e:
-        print(f"    ! Error while programming DB rules for {sw.name}: {e}")
+        logger.warning("    ! Error while programming DB rules for %s: %s", sw.name, e)
         if isinstance(e, grpc.RpcError):
             printGrpcError(e)
+        # switch state is unknown now: the next call rewrites everything
+        if entry_cache is not None:
+            entry_cache.clear()
         raise
     # return the list of rule IDs programmed
     return rule_list
@@ -375,19 +1182,29 @@ def program_config_rules(sw_name, sw_addr, device_id):
     :param device_id: the device ID of switch
     :return: (sw_connection, p4info_helper)
     """
-    print(f"\n----- Connecting to {sw_name} @ {sw_addr} (device_id={device_id}) -----")
+    logger.info("\n----- Connecting to %s @ %s (device_id=%s) -----", sw_name, sw_addr, device_id)
     proto_dump = f"logs/{sw_name}-p4runtime.txt"
-    sw = p4runtime_lib.bmv2.Bmv2SwitchConnection(
+    sw = TunedBmv2SwitchConnection(
         name=sw_name,
         address=sw_addr,
         device_id=device_id,
         proto_dump_file=proto_dump)
 
+    # fail fast on an unreachable switch instead of stalling in arbitration;
+    # the future keeps watching the channel until it is cancelled
+    ready = grpc.channel_ready_future(sw.channel)
+    try:
+        ready.result(timeout=GRPC_READY_TIMEOUT)
+    except grpc.FutureTimeoutError:
+        ready.cancel()
+        logger.warning("    ! %s @ %s not reachable within %ss", sw_name, sw_addr, GRPC_READY_TIMEOUT)
+        raise
+
     # acquire mastership
     try:
         sw.MasterArbitrationUpdate()
     except Exception as e:
-        print(f"    ! Master arbitration/update failed for {sw_name}: {e}")
+        logger.warning("    ! Master arbitration/update failed for %s: %s", sw_name, e)
         raise
 
     # try to find config JSON for this switch
@@ -396,7 +1213,7 @@ def program_config_rules(sw_name, sw_addr, device_id):
         # choose p4info helper and bmv2_json path from either config or defaults
         p4info_path = config.get('p4info', DEFAULT_P4INFO)
         bmv2_json = config.get('bmv2_json', DEFAULT_BMV2_JSON)
-        p4info_helper = p4runtime_lib.helper.P4InfoHelper(p4info_path)
+        p4info_helper = load_p4info(p4info_path)
 
         # install pipeline if bmv2_json is provided
         if bmv2_json:
@@ -410,17 +1227,17 @@ def program_config_rules(sw_name, sw_addr, device_id):
                 tname, tentry = build_entry_from_json(p4info_helper, entry)
                 tbl_entries.append((tname, tentry))
             except Exception as ex:
-                print(f"    ! Error building table entry from JSON: {ex}")
+                logger.warning("    ! Error building table entry from JSON: %s", ex)
                 raise
 
         # write forwarding entries first
         if tbl_entries:
-            print(f"    -> Writing {len(tbl_entries)} forwarding entries (config) to {sw_name}")
+            logger.info("    -> Writing %d forwarding entries (config) to %s", len(tbl_entries), sw_name)
             write_entries(sw, tbl_entries)
         else:
-            print(f"    -> No table entries found in {sw_name}-config.json")
+            logger.info("    -> No table entries found in %s-config.json", sw_name)
     else:
-        print(f"    ! Error no config file for {sw_name} (Not Found: {sw_name}-config.json)")
+        logger.warning("    ! Error no config file for %s (Not Found: %s-config.json)", sw_name, sw_name)
         raise
 
     # Return the the p4info helper used and switch connection
@@ -431,155 +1248,329 @@ def program_config_rules(sw_name, sw_addr, device_id):
 def read_table_rules(p4info_helper, sw):
     """
     Reads the table entries from all tables on the switch.
+    All entries are formatted first and logged with a single call.
 
     :param p4info_helper: the P4Info helper
     :param sw: the switch connection
     """
-    print('\n----- Reading tables rules for %s -----' % sw.name)
+    lines = ['\n----- Reading tables rules for %s -----' % sw.name]
     for response in sw.ReadTableEntries():
         for entity in response.entities:
             entry = entity.table_entry
+            line = io.StringIO()
             try:
                 table_name = p4info_helper.get_tables_name(entry.table_id)
             except Exception:
                 table_name = f"<table id {entry.table_id}>"
-            print('%s: ' % table_name, end=' ')
+            line.write(f"{table_name}:  ")
             for m in entry.match:
                 try:
-                    print(p4info_helper.get_match_field_name(table_name, m.field_id), end=' ')
-                    print('%r' % (p4info_helper.get_match_field_value(m),), end=' ')
+                    line.write(f"{p4info_helper.get_match_field_name(table_name, m.field_id)} ")
+                    line.write(f"{p4info_helper.get_match_field_value(m)!r} ")
                 except Exception:
-                    print(f"<match field id {m.field_id}> ", end='')
+                    line.write(f"<match field id {m.field_id}> ")
             action = entry.action.action
             try:
                 action_name = p4info_helper.get_actions_name(action.action_id)
             except Exception:
                 action_name = f"<action id {action.action_id}>"
-            print('->', action_name, end=' ')
+            line.write(f"-> {action_name} ")
             for p in action.params:
                 try:
-                    print(p4info_helper.get_action_param_name(action_name, p.param_id), end=' ')
-                    print('%r' % p.value, end=' ')
+                    line.write(f"{p4info_helper.get_action_param_name(action_name, p.param_id)} ")
+                    line.write(f"{p.value!r} ")
                 except Exception:
-                    print(f"<param id {p.param_id} {repr(p.value)}> ", end='')
-            print()
+                    line.write(f"<param id {p.param_id} {p.value!r}> ")
+            lines.append(line.getvalue())
+    logger.info("\n".join(lines))
 
 
-def printCounter(p4info_helper, sw, counter_name, rule_list):
+def read_counters(p4info_helper, sw, counter_name, rule_list):
     """
-    Reads the specified counter at the specified index from the switch. In our
+    Reads the specified counter at the specified indexes from the switch. In our
     program, the index is the rule ID in DB.
 
     :param p4info_helper: the P4Info helper
     :param sw: the switch connection
     :param counter_name: the name of the counter from the P4 program
-    :param index: the counter index (in our case, the rule ID in DB)
+    :param rule_list: the counter indexes (in our case, the rule IDs in DB)
+    :return: list of formatted lines (empty if there are no rules)
     """
+    lines = []
     if rule_list:
-        print("  %s %s" % (sw.name, counter_name))
+        lines.append("  %s %s" % (sw.name, counter_name))
         for index in rule_list:
             for response in sw.ReadCounters(p4info_helper.get_counters_id(counter_name), index):
                 for entity in response.entities:
                     counter = entity.counter_entry
-                    print("    %d: %d packets" % (index, counter.data.packet_count))
+                    lines.append("    %d: %d packets" % (index, counter.data.packet_count))
+    return lines
+
+
+def print_all_counters(executor, all_conns):
+    """
+    Read the rule counters of all switches concurrently and log them in switch order.
+
+    :param executor: ThreadPoolExecutor running the reads
+    :param all_conns: dict sw_name -> { 'sw_conn', 'p4info_helper', 'rules', ... }
+    """
+    futures = [
+        (sw_name, executor.submit(read_counters, sw_info['p4info_helper'], sw_info['sw_conn'],
+                                  "tag_rule" if sw_name in TAG_SWITCH else "filter_rule",
+                                  sw_info.get('rules')))
+        for sw_name, sw_info in list(all_conns.items())
+    ]
+    for sw_name, future in futures:
+        try:
+            lines = future.result()
+        except Exception as e:
+            logger.warning("  ! Failed to read counters of %s: %s", sw_name, e)
+            continue
+        if lines:
+            logger.info("\n".join(lines))
+
+
+def report_counters(all_conns, stop, interval=COUNTER_INTERVAL):
+    """
+    Background thread body: print all rule counters every interval seconds until stop is set.
+    The worker threads are created once and reused for every report.
+
+    :param all_conns: dict sw_name -> switch info, see print_all_counters
+    :param stop: threading.Event
+    :param interval: seconds between reports
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(all_conns)), thread_name_prefix="counters") as executor:
+        while not stop.wait(interval):
+            print_all_counters(executor, all_conns)
 
 # ---------------- main ----------------
+def program_switch(sw_name, sw_addr, device_id, rules=None, fingerprint=None):
+    """
+    Initial programming of one switch: config rules, then DB rules.
+    Runs in a worker thread, so it borrows its own connection from the DB pool
+    (psycopg2 connections must not be shared between threads without locking).
+
+    :param sw_name: the switch name
+    :param sw_addr: the switch address
+    :param device_id: the device ID of switch
+    :param rules: optional prefetched (tag_rows, filter_rows) for this switch
+    :param fingerprint: DB fingerprint taken before rules were prefetched
+    :return: dict { 'sw_conn', 'p4info_helper', 'hash', 'rules', 'entries' }
+    """
+    # install config-based rules (forwarding rules)
+    p4info_helper, sw_conn = program_config_rules(sw_name, sw_addr, device_id)
+    entry_cache = {}
+
+    try:
+        with db_connection() as db_conn:
+            # initial fingerprint of DB state for this switch, taken before its rules
+            # are read: a change in between makes the next poll see a difference
+            h = fingerprint if rules is not None else compute_db_hash(db_conn, sw_name)
+            # install DB rules (tagging/filtering rules)
+            rule_list = program_db_rules(db_conn, p4info_helper, sw_conn, rules, entry_cache)
+    except psycopg2.Error as e:
+        logger.warning("    ! DB unavailable for %s (config rules only): %s", sw_name, e)
+        rule_list, h = None, None
+    return {'sw_conn': sw_conn, 'p4info_helper': p4info_helper, 'hash': h, 'rules': rule_list,
+            'entries': entry_cache}
+
+
+def poll_switches(executor, db_conn, all_conns, changed=None):
+    """
+    One watch-loop round: reprogram the DB rules of each switch whose rules changed
+    (concurrently, from one prefetch query). Counters are reported separately,
+    see report_counters.
+
+    Without changed, the DB fingerprints of all programmed switches are computed
+    (one query) and compared with the stored ones. With changed (the switch names
+    from wait_for_changes), only those switches are reprogrammed.
+
+    :param executor: ThreadPoolExecutor running the per-switch programming
+    :param db_conn: psycopg2 connection
+    :param all_conns: dict sw_name -> { 'sw_conn', 'p4info_helper', 'hash', 'rules', 'entries' }
+    :param changed: optional set of switch names reported as changed
+    """
+    candidates = list(all_conns) if changed is None else [n for n in all_conns if n in changed]
+    hashes = {}
+    if candidates:
+        try:
+            hashes = compute_all_db_hashes(db_conn, candidates)
+        except Exception as e:
+            logger.warning("    ! Error computing fingerprints: %s", e)
+
+    if changed is None:
+        changed_sw = [n for n in candidates if hashes.get(n) != all_conns[n].get('hash')]
+    else:
+        # a notification is authoritative: a transaction that started before the
+        # last fingerprint can commit an older updated_at, so do not second-guess it
+        changed_sw = candidates
+    if changed_sw:
+        for sw_name in changed_sw:
+            logger.info("  [-] Detected DB change for %s (old=%s new=%s)", sw_name, all_conns[sw_name].get('hash'), hashes.get(sw_name))
+        # one query for the rules of every changed switch, then program them concurrently
+        try:
+            rules_by_sw = fetch_all_rules(db_conn, changed_sw)
+        except psycopg2.Error as e:
+            logger.warning("    ! Failed to fetch DB rules: %s", e)
+            rules_by_sw = None
+        if rules_by_sw is not None:
+            futures = {
+                sw_name: executor.submit(program_db_rules, None, all_conns[sw_name]['p4info_helper'],
+                                         all_conns[sw_name]['sw_conn'], rules_by_sw[sw_name],
+                                         all_conns[sw_name]['entries'])
+                for sw_name in changed_sw
+            }
+            for sw_name, future in futures.items():
+                try:
+                    rule_list = future.result()
+                except Exception as e:
+                    logger.warning("    ! Failed to program DB rules for %s: %s", sw_name, e)
+                    # continue (do not abort overall)
+                    continue
+                logger.info("  [-] Successfully apply new rule for %s", sw_name)
+                all_conns[sw_name] = dict(all_conns[sw_name], hash=hashes.get(sw_name), rules=rule_list)
+
+
+def shutdown_switch_connections(timeout=SHUTDOWN_TIMEOUT):
+    """
+    Shut down every open switch connection concurrently (replaces the sequential
+    ShutdownAllSwitchConnections). Connections still closing after timeout seconds
+    are abandoned so they cannot block process exit.
+
+    :param timeout: seconds to wait for all connections in total
+    """
+    threads = []
+    for conn in list(connections):
+        # daemon threads: a stuck channel must not keep the interpreter alive
+        t = threading.Thread(target=conn.shutdown, name=f"shutdown-{conn.name}", daemon=True)
+        t.start()
+        threads.append(t)
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.join(max(0, deadline - time.monotonic()))
+        if t.is_alive():
+            logger.warning("[!] Timed out shutting down %s", t.name[len('shutdown-'):])
+
+
 def main():
+    # P4CTL_LOG_LEVEL=DEBUG shows per-entry write/delete messages
+    logging.basicConfig(level=os.environ.get("P4CTL_LOG_LEVEL", "INFO").upper(), format="%(message)s",
+                        stream=sys.stdout)
     all_conns = {}
-    db_conn = None
+    listen_conn = None
+    stop_counters = threading.Event()
+    watch_executor = None
     try:
         # try connect to DB once
         try:
-            db_conn = get_db_conn()
-            print(f"[+] Connected to DB")
+            get_db_pool()
+            logger.info("[+] Connected to DB")
         except Exception as e:
-            print(f"[!] Could not connect to DB (will still program configs): {e}")
-            db_conn = None
+            logger.warning("[!] Could not connect to DB (will still program configs): %s", e)
 
         # assemble the list of switches to program
         switches = {}
         switches.update(FILTER_SWITCH)
         switches.update(TAG_SWITCH)
 
-        for sw_name, (addr, dev_id) in switches.items():
-            try:
-                # install config-based rules (forwarding rules)
-                p4info_helper, sw_conn = program_config_rules(sw_name, addr, dev_id)
-                # install DB rules (tagging/filtering rules) 
-                rule_list = program_db_rules(db_conn, p4info_helper, sw_conn)
-
-                # compute initial fingerprint of DB state for this switch
-                h = compute_db_hash(db_conn, sw_name)
-                all_conns[sw_name] = {'sw_conn': sw_conn, 'p4info_helper': p4info_helper, 'hash': h, 'rules': rule_list}
-                
-                # read back tables
-                read_table_rules(p4info_helper, sw_conn)
-            except Exception as e:
-                print(f"[!] Error during programming of {sw_name}: {e}")
-                continue
-
-        print("----- Initial programming complete. Entering watch loop. Press Ctrl-C to stop. -----")
-
-        while True:
-            print(f"[+] Start Detect")
-            # ensure DB connection alive
-            if db_conn is None:
+        # LISTEN before reading any rules: changes committed while the switches are
+        # being programmed are queued on this connection and handled by the watch loop
+        try:
+            listen_conn = open_listen_conn()
+        except psycopg2.Error as e:
+            logger.warning("[!] Could not listen for DB changes: %s", e)
+        if listen_conn is None:
+            logger.warning("[!] DB notify triggers not installed (dbdata/notify_triggers.sql); polling every %ss", POLL_INTERVAL)
+
+        # prefetch the DB rules of every switch in a single query; the fingerprints
+        # are taken first, so a change after them shows up at the next poll
+        rules_by_sw = {}
+        hashes_by_sw = {}
+        try:
+            with db_connection() as db_conn:
+                hashes_by_sw = compute_all_db_hashes(db_conn, switches.keys())
+                rules_by_sw = fetch_all_rules(db_conn, switches.keys())
+        except psycopg2.Error as e:
+            logger.warning("[!] Could not prefetch DB rules: %s", e)
+
+        # switches are independent: program them concurrently; each switch's
+        # read-back (P4CTL_DUMP=1 or DEBUG logging) is queued as soon as it is
+        # programmed, overlapping the others
+        dump_tables = DUMP_TABLES or logger.isEnabledFor(logging.DEBUG)
+        with ThreadPoolExecutor(max_workers=len(switches)) as executor:
+            futures = {
+                executor.submit(program_switch, sw_name, addr, dev_id,
+                                rules_by_sw.get(sw_name), hashes_by_sw.get(sw_name)): sw_name
+                for sw_name, (addr, dev_id) in switches.items()
+            }
+            reads = []
+            for future in as_completed(futures):
+                sw_name = futures[future]
                 try:
-                    db_conn = get_db_conn()
-                    print("  [+] Reconnected to DB")
-                except Exception:
-                    # still not available; skip this round
-                    time.sleep(POLL_INTERVAL)
+                    sw_info = future.result()
+                except Exception as e:
+                    logger.warning("[!] Error during programming of %s: %s", sw_name, e)
                     continue
+                all_conns[sw_name] = sw_info
+                # read back tables
+                if dump_tables:
+                    reads.append(executor.submit(read_table_rules, sw_info['p4info_helper'], sw_info['sw_conn']))
 
-            # for each programmed switch, compute new fingerprint and compare
-            for sw_name, sw_info in list(all_conns.items()):
+            for future in reads:
                 try:
-                    new_h = compute_db_hash(db_conn, sw_name)
+                    future.result()
                 except Exception as e:
-                    print(f"    ! Error computing fingerprint for {sw_name}: {e}")
-                    new_h = None
-
-                sw_conn = sw_info.get('sw_conn')
-                p4info_helper = sw_info.get('p4info_helper')
-                old_h = sw_info.get('hash')
-                rule_list = sw_info.get('rules', [])
-
-                # compare fingerprints
-                if new_h != old_h:
-                    print(f"  [-] Detected DB change for {sw_name} (old={old_h} new={new_h})")
-                    
-                    try:
-                        rule_list = program_db_rules(db_conn, p4info_helper, sw_conn)
-                    except Exception as e:
-                        print(f"    ! Failed to program DB rules for {sw_name}: {e}")
-                        # continue (do not abort overall)
-                        continue
-                    print(f"  [-] Successfully apply new rule for {sw_name}")
-                    all_conns[sw_name] = {'sw_conn': sw_conn, 'p4info_helper': p4info_helper, 'hash': new_h, 'rules': rule_list}
-                # else:
-                #     # no change
-                #     print(f"  [-] No rule change for {sw_name}")
-
-                if sw_conn.name in TAG_SWITCH:
-                    printCounter(p4info_helper, sw_conn, "tag_rule", rule_list)
-                else:
-                    printCounter(p4info_helper, sw_conn, "filter_rule", rule_list)
+                    logger.warning("[!] Error while reading back tables: %s", e)
 
-            print(f"[+] End Detect")
+        # keep the watch loop (and its counter output) in switch order
+        all_conns = {sw_name: all_conns[sw_name] for sw_name in switches if sw_name in all_conns}
 
-                
+        # counters are read in the background so they never delay change handling
+        threading.Thread(target=report_counters, args=(all_conns, stop_counters),
+                         name="counters", daemon=True).start()
+
+        # worker threads for reprogramming, created once for the whole watch loop
+        watch_executor = ThreadPoolExecutor(max_workers=max(1, len(all_conns)), thread_name_prefix="watch")
+
+        logger.info("----- Initial programming complete. Entering watch loop. Press Ctrl-C to stop. -----")
+
+        while True:
+            changed = None
+            if listen_conn is not None:
+                try:
+                    changed = wait_for_changes(listen_conn, POLL_INTERVAL)
+                except psycopg2.Error as e:
+                    logger.warning("  ! Lost DB notification connection, falling back to polling: %s", e)
+                    listen_conn.close()
+                    listen_conn = None
+            if listen_conn is None:
+                time.sleep(POLL_INTERVAL)
+            elif not changed:
+                # woke up on timeout: nothing changed
+                continue
+
+            logger.info("[+] Start Detect")
+            # borrow a DB connection for this round
+            try:
+                with db_connection() as db_conn:
+                    poll_switches(watch_executor, db_conn, all_conns, changed)
+            except psycopg2.Error as e:
+                # still not available; skip this round
+                logger.warning("  ! DB unavailable, skipping this round: %s", e)
 
+            logger.info("[+] End Detect")
 
-            time.sleep(POLL_INTERVAL)
-            
-            
     except KeyboardInterrupt:
-        print("[!] Interrupted by user")
+        logger.warning("[!] Interrupted by user")
     finally:
-        db_conn.close()
+        stop_counters.set()
+        if watch_executor is not None:
+            watch_executor.shutdown(wait=False)
+        if listen_conn is not None:
+            listen_conn.close()
+        close_db_pool()
         print("[+] Shutting down connections (global)...")
-        ShutdownAllSwitchConnections()
+        shutdown_switch_connections()
         print("[+] Shutdown complete.")
 
 
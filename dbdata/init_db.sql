@@ -20,22 +20,67 @@ CREATE TABLE IF NOT EXISTS tag_table (
   id SERIAL PRIMARY KEY,
   switch_name TEXT NOT NULL REFERENCES switches(name) ON DELETE CASCADE,
   match JSONB,         -- e.g. {"hdr.ipv4.srcAddr":["192.168.11.0",24]}
-  tag_value INT        -- DSCP or tag code to set
+  tag_value INT,       -- DSCP or tag code to set
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()   -- last change, set by trigger
 );
 
 -- Create filter_table: rules to filter by tag_value (e.g. drop if matches)
 CREATE TABLE IF NOT EXISTS filter_table (
   id SERIAL PRIMARY KEY,
   switch_name TEXT NOT NULL REFERENCES switches(name) ON DELETE CASCADE,
-  tag_value INT        -- tag value to filter (drop)
+  tag_value INT,       -- tag value to filter (drop)
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()   -- last change, set by trigger
 );
 
--- Indexes for faster lookup
-CREATE INDEX IF NOT EXISTS idx_tag_table_switch ON tag_table(switch_name);
-CREATE INDEX IF NOT EXISTS idx_filter_table_switch ON filter_table(switch_name);
+-- Indexes for faster lookup: the controller reads rules per switch ordered by id,
+-- so (switch_name, id) covering indexes serve those queries with index-only scans
+CREATE INDEX IF NOT EXISTS idx_tag_table_switch_id ON tag_table(switch_name, id) INCLUDE (match, tag_value);
+CREATE INDEX IF NOT EXISTS idx_filter_table_switch_id ON filter_table(switch_name, id) INCLUDE (tag_value);
+-- (switch_name, updated_at) indexes answer the controller's change fingerprint
+-- (row count, max(updated_at)) per switch; same definitions as updated_at.sql
+CREATE INDEX IF NOT EXISTS idx_tag_table_switch_updated ON tag_table(switch_name, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_filter_table_switch_updated ON filter_table(switch_name, updated_at DESC);
 -- GIN index for JSONB 'match' to allow JSON containment queries
 CREATE INDEX IF NOT EXISTS idx_tag_table_match_gin ON tag_table USING GIN (match jsonb_path_ops);
 
+-- Keep updated_at current on every insert/update
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at = clock_timestamp();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tag_table_updated_at
+  BEFORE INSERT OR UPDATE ON tag_table
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE OR REPLACE TRIGGER filter_table_updated_at
+  BEFORE INSERT OR UPDATE ON filter_table
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Notify the controller (channel tag_change / filter_change, payload = switch_name)
+-- when rules change; same definitions as notify_triggers.sql
+CREATE OR REPLACE FUNCTION notify_rule_change() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    PERFORM pg_notify(TG_ARGV[0], OLD.switch_name);
+  END IF;
+  IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.switch_name IS DISTINCT FROM OLD.switch_name) THEN
+    PERFORM pg_notify(TG_ARGV[0], NEW.switch_name);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tag_table_notify
+  AFTER INSERT OR UPDATE OR DELETE ON tag_table
+  FOR EACH ROW EXECUTE FUNCTION notify_rule_change('tag_change');
+
+CREATE OR REPLACE TRIGGER filter_table_notify
+  AFTER INSERT OR UPDATE OR DELETE ON filter_table
+  FOR EACH ROW EXECUTE FUNCTION notify_rule_change('filter_change');
+
 -- Example switch entries (adjust IPs & deviceIDs as needed)
 INSERT INTO switches (name, ip, deviceID) VALUES
   ('s11', '127.0.0.1:50051', 0),
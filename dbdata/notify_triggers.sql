@@ -0,0 +1,29 @@
+-- notify_triggers.sql
+-- Send a NOTIFY (channel tag_change / filter_change, payload = switch_name) whenever
+-- a rule row changes, so the controller wakes up only for switches whose rules changed.
+-- Safe to run repeatedly; init_db.sql creates the same triggers for new databases.
+-- For a database created before the triggers existed:
+--   docker exec -i p4-postgres psql -U p4 -d p4controller < dbdata/notify_triggers.sql
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_rule_change() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    PERFORM pg_notify(TG_ARGV[0], OLD.switch_name);
+  END IF;
+  IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.switch_name IS DISTINCT FROM OLD.switch_name) THEN
+    PERFORM pg_notify(TG_ARGV[0], NEW.switch_name);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tag_table_notify
+  AFTER INSERT OR UPDATE OR DELETE ON tag_table
+  FOR EACH ROW EXECUTE FUNCTION notify_rule_change('tag_change');
+
+CREATE OR REPLACE TRIGGER filter_table_notify
+  AFTER INSERT OR UPDATE OR DELETE ON filter_table
+  FOR EACH ROW EXECUTE FUNCTION notify_rule_change('filter_change');
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- switch_id_indexes.sql
+-- Replace the single-column switch_name indexes with (switch_name, id) covering indexes,
+-- matching init_db.sql. The controller reads rules per switch ordered by id, which these
+-- turn into index-only scans without a sort. Safe to run repeatedly; CONCURRENTLY keeps the
+-- tables writable, so run it outside a transaction:
+--   docker exec -i p4-postgres psql -U p4 -d p4controller < dbdata/switch_id_indexes.sql
+-- (controller_db.py also creates the indexes, non-concurrently, if they are missing.)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tag_table_switch_id ON tag_table(switch_name, id) INCLUDE (match, tag_value);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_filter_table_switch_id ON filter_table(switch_name, id) INCLUDE (tag_value);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_tag_table_switch;
+DROP INDEX CONCURRENTLY IF EXISTS idx_filter_table_switch;
@@ -0,0 +1,30 @@
+-- updated_at.sql
+-- Add an updated_at timestamp (maintained by a trigger) to the rule tables, matching
+-- init_db.sql. The controller fingerprints a switch's rules as (row count, max(updated_at))
+-- per table, answered from the (switch_name, updated_at) indexes instead of reading every row.
+-- Safe to run repeatedly; controller_db.py also applies it at startup if it is missing:
+--   docker exec -i p4-postgres psql -U p4 -d p4controller < dbdata/updated_at.sql
+BEGIN;
+
+ALTER TABLE tag_table ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE filter_table ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at = clock_timestamp();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tag_table_updated_at
+  BEFORE INSERT OR UPDATE ON tag_table
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE OR REPLACE TRIGGER filter_table_updated_at
+  BEFORE INSERT OR UPDATE ON filter_table
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_tag_table_switch_updated ON tag_table(switch_name, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_filter_table_switch_updated ON filter_table(switch_name, updated_at DESC);
+
+COMMIT;
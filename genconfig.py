@@ -9,9 +9,20 @@ Adjust the constants below if you want different p4info / bmv2 json paths.
 """
 import os
 import json
+import hashlib
+import socket
+
+try:
+    import orjson    # optional, faster JSON serialization
+except ImportError:
+    orjson = None
 
 # Output directory for per-switch configs
 OUT_DIR = "configs"
+# all configs in one JSON file, preferred by the controller over the per-switch files
+ALL_CONFIGS_FILE = "all.json"
+# bump when the layout of ALL_CONFIGS_FILE changes; the controller ignores other versions
+ALL_CONFIGS_VERSION = 1
 
 # P4 artifacts (match the names used by your controller)
 TAG_P4INFO_FILE = "build/tag.p4.p4info.txtpb"
@@ -25,6 +36,8 @@ BASIC_P4INFO_FILE = "build/basic.p4.p4info.txtpb"
 BASIC_BMV2_JSON = "build/basic.json"
 
 # DSCP constants used in your controller
+# (tag/filter rules are no longer part of these configs; they live in the DB,
+#  see dbdata/init_db.sql tag_table/filter_table)
 DSCP_A = 10   # Class A tag
 DSCP_B = 11   # Class B tag
 DSCP_C = 12   # Class C tag
@@ -40,7 +53,6 @@ SWITCH_CONFIGS = {
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.11.1", 32] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:01:11", "port": 1 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.11.2", 32] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:01:22", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.0.0", 16] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:21:00", "port": 3 } }
-            # { "table": "MyEgress.filter_dscp_tag", "match": { "hdr.ipv4.diffserv": [DSCP_C, 8] }, "action_name": "MyEgress.drop", "action_params": {} }
         ]
     },
     "s12": {
@@ -83,8 +95,6 @@ SWITCH_CONFIGS = {
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.11.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:11:00", "port": 1 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.12.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:12:00", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.0.0", 16] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:22:00", "port": 3 } }
-            # { "table": "MyEgress.set_dscp_tag", "match": { "hdr.ipv4.srcAddr": ["192.168.11.0", 24] }, "action_name": "MyEgress.modify_dscp", "action_params": { "dscp_value": DSCP_A } },
-            # { "table": "MyEgress.set_dscp_tag", "match": { "hdr.ipv4.srcAddr": ["192.168.12.0", 24] }, "action_name": "MyEgress.modify_dscp", "action_params": { "dscp_value": DSCP_B } }
         ]
     },
     "s22": {
@@ -96,7 +106,6 @@ SWITCH_CONFIGS = {
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.11.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:21:00", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.12.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:21:00", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.14.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:23:00", "port": 3 } }
-            # { "table": "MyEgress.set_dscp_tag", "match": { "hdr.ipv4.srcAddr": ["192.168.13.0", 24] }, "action_name": "MyEgress.modify_dscp", "action_params": { "dscp_value": DSCP_C } }
         ]
     },
     "s23": {
@@ -108,7 +117,6 @@ SWITCH_CONFIGS = {
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.11.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:22:00", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.12.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:22:00", "port": 2 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.14.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:24:00", "port": 3 } }
-            # { "table": "MyEgress.set_dscp_tag", "match": { "hdr.ipv4.srcAddr": ["192.168.13.0", 24] }, "action_name": "MyEgress.modify_dscp", "action_params": { "dscp_value": DSCP_C } }
         ]
     },
     "s24": {
@@ -118,7 +126,6 @@ SWITCH_CONFIGS = {
             { "table": "MyIngress.ipv4_lpm", "default_action": True, "action_name": "MyIngress.drop", "action_params": {} },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.14.0", 24] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:14:00", "port": 1 } },
             { "table": "MyIngress.ipv4_lpm", "match": { "hdr.ipv4.dstAddr": ["192.168.0.0", 16] }, "action_name": "MyIngress.ipv4_forward", "action_params": { "dstAddr": "08:00:00:00:23:00", "port": 2 } }
-            # { "table": "MyEgress.set_dscp_tag", "match": { "hdr.ipv4.srcAddr": ["192.168.14.0", 24] }, "action_name": "MyEgress.modify_dscp", "action_params": { "dscp_value": DSCP_D } }
         ]
     }
     # optionally add others...
@@ -128,13 +135,79 @@ def ensure_out_dir():
     if not os.path.exists(OUT_DIR):
         os.makedirs(OUT_DIR)
 
+def ip4(s):
+    return socket.inet_aton(s).hex()
+
+def mac(s):
+    return s.replace(':', '').lower()
+
+def pack_value(v):
+    """
+    Return the hex form of an IPv4 or MAC literal, or None for other values.
+    """
+    if isinstance(v, str):
+        if v.count(':') == 5:
+            return mac(v)
+        if v.count('.') == 3:
+            return ip4(v)
+    return None
+
+def pack_fields(fields):
+    """
+    Rename IPv4/MAC fields to "<name>_hex" with pre-packed hex values, so the
+    controller decodes them with bytes.fromhex instead of parsing the strings.
+    [value, prefix_len] lists keep their prefix length.
+    """
+    out = {}
+    for k, v in fields.items():
+        packed = pack_value(v[0] if isinstance(v, list) and v else v)
+        if packed is None:
+            out[k] = v
+        elif isinstance(v, list):
+            out[f"{k}_hex"] = [packed] + v[1:]
+        else:
+            out[f"{k}_hex"] = packed
+    return out
+
+def pack_config(cfg):
+    """
+    Copy of a switch config with the match and action_params of every entry packed.
+    """
+    entries = []
+    for e in cfg.get("table_entries", []):
+        e = dict(e)
+        if "match" in e:
+            e["match"] = pack_fields(e["match"])
+        if "action_params" in e:
+            e["action_params"] = pack_fields(e["action_params"])
+        entries.append(e)
+    return {**cfg, "table_entries": entries}
+
+def dump_config(cfg):
+    """
+    Serialize one switch config to indented JSON bytes (orjson when installed).
+    """
+    if orjson is not None:
+        return orjson.dumps(cfg, option=orjson.OPT_INDENT_2)
+    return json.dumps(cfg, indent=2).encode()
+
 def write_configs():
     ensure_out_dir()
-    for sw_name, cfg in SWITCH_CONFIGS.items():
+    packed = {sw_name: pack_config(cfg) for sw_name, cfg in SWITCH_CONFIGS.items()}
+    # file name -> sha256 of its content, so the controller can tell when a
+    # per-switch file no longer matches the combined one
+    sources = {}
+    for sw_name, cfg in packed.items():
         out_path = os.path.join(OUT_DIR, f"{sw_name}-config.json")
-        with open(out_path, 'w') as f:
-            json.dump(cfg, f, indent=2)
+        data = dump_config(cfg)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        sources[os.path.basename(out_path)] = hashlib.sha256(data).hexdigest()
         print(f"Wrote {out_path}")
+    out_path = os.path.join(OUT_DIR, ALL_CONFIGS_FILE)
+    with open(out_path, 'wb') as f:
+        f.write(dump_config({"version": ALL_CONFIGS_VERSION, "sources": sources, "configs": packed}))
+    print(f"Wrote {out_path}")
 
 if __name__ == "__main__":
     write_configs()